@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+""" startup_benchmark.py: Measures the startup cost of refgenDetector for each --type.
+
+For every file type the command line tool is run several times on a small input with -X importtime. The wall time of
+the whole run, the time spent importing modules and the heaviest imports are reported, next to the cost of starting a
+bare interpreter, so regressions in the imports of a code path are easy to spot.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--repeat N] [--top N]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+MAIN = REPO / "src" / "refgenDetector" / "refgenDetector_main.py"
+EXAMPLES = REPO / "examples"
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+TINY_VCF = (
+    "##fileformat=VCFv4.2\n"
+    "##contig=<ID=chr21,length=46709983>\n"
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+    "chr21\t5030000\t.\tA\tG\t50\tPASS\t.\n"
+    "chr21\t5030100\t.\tC\tT\t50\tPASS\t.\n"
+)
+
+# Same variants as TINY_VCF, as a PLINK .bim (chromosome, ID, cM, position, A1, A2)
+TINY_BIM = (
+    "21\trs1\t0\t5030000\tG\tA\n"
+    "21\trs2\t0\t5030100\tT\tC\n"
+)
+
+
+def benchmark_inputs(tmp_dir):
+    """
+    Returns the input used for each --type: the examples shipped with the repository, a tiny VCF and a tiny .bim.
+    """
+    vcf = Path(tmp_dir) / "tiny.vcf"
+    vcf.write_text(TINY_VCF)
+    bim = Path(tmp_dir) / "tiny.bim"
+    bim.write_text(TINY_BIM)
+    bam = next((EXAMPLES / "TEST_BAM_CRAM").glob("*.bam"))
+    return {
+        "Header": EXAMPLES / "TEST_HEADERS" / "header_mm10",
+        "BAM/CRAM": bam,
+        "VCF": vcf,
+        "BIM": bim,
+    }
+
+
+def run_once(command):
+    """
+    Runs the command with -X importtime.
+    Returns:
+        wall time (s), total import time (s) and the cumulative import time (s) of each top level module
+    """
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime"] + command, capture_output=True, text=True,
+                               cwd=MAIN.parent)
+    wall = time.perf_counter() - start
+    total_self = 0
+    top_level = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        total_self += int(self_us)
+        if len(indent) == 1:  # modules imported directly by the tool, not by another import
+            top_level[module] = int(cumulative_us) / 1e6
+    return wall, total_self / 1e6, top_level
+
+
+def benchmark(command, repeat):
+    """
+    Runs the command `repeat` times and keeps the median wall and import times and the imports of the fastest run.
+    """
+    runs = [run_once(command) for _ in range(repeat)]
+    walls = [run[0] for run in runs]
+    imports = [run[1] for run in runs]
+    fastest = min(runs, key=lambda run: run[0])
+    return statistics.median(walls), statistics.median(imports), fastest[2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark of refgenDetector for each --type.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per file type. [DEFAULT: 5]")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest imports shown per file type. [DEFAULT: 5]")
+    args = parser.parse_args()
+
+    bare_wall, bare_imports, _ = benchmark(["-c", "pass"], args.repeat)
+    print(f"{'type':<10} {'wall (s)':>9} {'imports (s)':>12}")
+    print(f"{'python':<10} {bare_wall:>9.3f} {bare_imports:>12.3f}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for file_type, path in benchmark_inputs(tmp_dir).items():
+            command = [str(MAIN), "-t", file_type, "-f", str(path), "-o", "jsonl"]
+            wall, imports, top_level = benchmark(command, args.repeat)
+            print(f"{file_type:<10} {wall:>9.3f} {imports:>12.3f}")
+            heaviest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]
+            for module, seconds in heaviest:
+                print(f"{'':<10}   {module:<40} {seconds:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -42,7 +42,7 @@ setup(
     author_email="<mireia.marin@crg.eu>",
     long_description=long_description,
     long_description_content_type='text/markdown',
-    install_requires=['pysam', 'psutil', 'rich', 'pandas', 'dnspython', 'msgpack', 'numpy'],
+    install_requires=['pysam', 'psutil', 'rich', 'msgpack', 'numpy'],
     keywords=['python'],
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -0,0 +1,226 @@
+"""
+Reader of the header of BAM and CRAM files, without htslib.
+
+Only the @SQ lines are needed to infer the reference genome, and they are in the first bytes of the file:
+
+    BAM   BGZF blocks whose content starts with "BAM\\1", the length of the header text and the text. The text is
+          followed by the list of references (name and length), used when the text has no @SQ lines.
+    CRAM  the file definition ("CRAM", version, file id) and the first container, whose first block holds the length
+          of the header text and the text (raw or compressed with gzip, bzip2 or lzma).
+    SAM   the lines starting with @, e.g. from samtools view -h, read until the first alignment.
+
+The blocks are read until the header is complete and nothing else: no record is decoded and, for CRAMs, the
+references are never looked up (REF_PATH, REF_CACHE or the EBI server), so a header check reads a few kilobytes
+(the size of the header) and never waits on the network.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import struct
+import zlib
+
+try:
+    # Works when installed as a pip package
+    from .bgzf import read_block, inflate_blocks
+    from .inputs import open_input, content_prefix, BAM_MAGIC, CRAM_MAGIC
+except ImportError:
+    # Works when run directly as a script
+    from bgzf import read_block, inflate_blocks
+    from inputs import open_input, content_prefix, BAM_MAGIC, CRAM_MAGIC
+
+CRAM_DEFINITION_BYTES = 26  # "CRAM", major and minor version, file id
+CRAM_READ_BYTES = 1 << 12  # bytes read at once from the first container of a CRAM
+INT32 = struct.Struct("<i")
+CRAM_BLOCK_METHODS = {0: lambda data: data,
+                      1: lambda data: zlib.decompress(data, zlib.MAX_WBITS | 32),  # gzip or zlib
+                      2: bz2.decompress,
+                      3: lzma.decompress}
+
+
+def read_itf8(data, offset):
+    """
+    Reads an ITF8 integer of a CRAM (1 to 5 bytes, the leading 1 bits of the first byte give the extra bytes).
+    Returns:
+        the value (signed 32-bit int) and the offset after it
+    """
+    first = data[offset]
+    if first < 0x80:
+        return first, offset + 1
+    if first < 0xC0:
+        value, size = ((first & 0x3F) << 8) | data[offset + 1], 2
+    elif first < 0xE0:
+        value, size = ((first & 0x1F) << 16) | (data[offset + 1] << 8) | data[offset + 2], 3
+    elif first < 0xF0:
+        value, size = (((first & 0x0F) << 24) | (data[offset + 1] << 16) | (data[offset + 2] << 8)
+                       | data[offset + 3]), 4
+    else:
+        value, size = (((first & 0x0F) << 28) | (data[offset + 1] << 20) | (data[offset + 2] << 12)
+                       | (data[offset + 3] << 4) | (data[offset + 4] & 0x0F)), 5
+    return value - (1 << 32) if value >= 1 << 31 else value, offset + size
+
+
+def read_ltf8(data, offset):
+    """
+    Reads an LTF8 integer of a CRAM (1 to 9 bytes, the leading 1 bits of the first byte give the extra bytes).
+    Returns:
+        the value (int) and the offset after it
+    """
+    first = data[offset]
+    extra = 0
+    while extra < 8 and first & (0x80 >> extra):
+        extra += 1
+    value = first & (0xFF >> (extra + 1)) if extra < 8 else 0
+    for byte in data[offset + 1:offset + 1 + extra]:
+        value = (value << 8) | byte
+    return value, offset + 1 + extra
+
+
+def read_bam_header(raw):
+    """
+    Reads the header of a BAM, inflating only the BGZF blocks that hold it.
+    Args:
+        raw: binary file opened at the start of the BAM
+
+    Returns:
+        the header text (str), with @SQ lines built from the list of references if the text has none
+    Raises:
+        ValueError if the file isn't a BAM or its header ends early, gzip.BadGzipFile if a BGZF block is truncated
+    """
+    data = b""
+
+    def ensure(size):
+        nonlocal data
+        while len(data) < size:
+            block = read_block(raw)
+            if not block:
+                raise ValueError("Truncated BAM header")
+            data += inflate_blocks([block])
+
+    ensure(8)
+    if data[:4] != BAM_MAGIC:
+        raise ValueError("Not a BAM file: BGZF compressed, but it doesn't start with BAM\\1")
+    text_length = INT32.unpack_from(data, 4)[0]
+    ensure(8 + text_length)
+    text = data[8:8 + text_length].rstrip(b"\0").decode("utf-8", "replace")
+    if "@SQ\t" in text:
+        return text
+
+    offset = 8 + text_length
+    ensure(offset + 4)
+    n_references = INT32.unpack_from(data, offset)[0]
+    offset += 4
+    lines = []
+    for _ in range(n_references):
+        ensure(offset + 4)
+        name_length = INT32.unpack_from(data, offset)[0]
+        ensure(offset + 8 + name_length)
+        name = data[offset + 4:offset + 4 + name_length].rstrip(b"\0").decode("utf-8", "replace")
+        length = INT32.unpack_from(data, offset + 4 + name_length)[0]
+        lines.append(f"@SQ\tSN:{name}\tLN:{length}")
+        offset += 8 + name_length
+    return "\n".join([text.rstrip("\n")] + lines) if text.strip() else "\n".join(lines)
+
+
+def read_cram_header(raw):
+    """
+    Reads the header of a CRAM from its file definition and the first block of its first container, without
+    decoding any record or looking up the references.
+    Args:
+        raw: binary file opened at the start of the CRAM
+
+    Returns:
+        the header text (str)
+    Raises:
+        ValueError if the file isn't a CRAM 2 or 3, or its header block is truncated or compressed with an
+        unsupported method
+    """
+    data = raw.read(CRAM_DEFINITION_BYTES + CRAM_READ_BYTES)
+    if len(data) < CRAM_DEFINITION_BYTES or data[:4] != CRAM_MAGIC:
+        raise ValueError("Not a CRAM file")
+    major = data[4]
+    if major not in (2, 3):
+        raise ValueError(f"CRAM version {major}.{data[5]} is not supported")
+    with_crc = major >= 3
+
+    # Container header: length, reference id, start, span, records, record counter, bases, blocks, landmarks (, CRC32)
+    offset = CRAM_DEFINITION_BYTES + 4
+    for _ in range(4):
+        _, offset = read_itf8(data, offset)
+    for _ in range(2):
+        _, offset = read_ltf8(data, offset)
+    _, offset = read_itf8(data, offset)
+    n_landmarks, offset = read_itf8(data, offset)
+    for _ in range(n_landmarks):
+        _, offset = read_itf8(data, offset)
+    offset += 4 if with_crc else 0
+
+    # First block: method, content type, content id, compressed size, raw size, data (, CRC32)
+    method, offset = data[offset], offset + 2
+    _, offset = read_itf8(data, offset)
+    compressed_size, offset = read_itf8(data, offset)
+    _, offset = read_itf8(data, offset)
+    if len(data) < offset + compressed_size:
+        data += raw.read(offset + compressed_size - len(data))
+    if len(data) < offset + compressed_size:
+        raise ValueError("Truncated CRAM header")
+    if method not in CRAM_BLOCK_METHODS:
+        raise ValueError(f"The CRAM header block is compressed with an unsupported method ({method})")
+    block = CRAM_BLOCK_METHODS[method](data[offset:offset + compressed_size])
+    text_length = INT32.unpack_from(block, 0)[0]
+    return block[4:4 + text_length].rstrip(b"\0").decode("utf-8", "replace")
+
+
+def read_text_sq_lines(lines):
+    """
+    Reads the @SQ lines of a SAM or of a header saved as text (e.g. samtools view -h / -H), stopping at the first
+    line that isn't a header line, so the alignments of a full SAM are never read. Blank lines are skipped.
+    Args:
+        lines: iterator of the lines (str) of the SAM, e.g. a text stream
+
+    Returns:
+        the @SQ lines (list[str]) of the header
+    """
+    sq_lines = []
+    for line in lines:
+        if not line.startswith("@"):
+            if line.strip():
+                break
+            continue
+        if line.startswith("@SQ\t"):
+            sq_lines.append(line.rstrip("\r\n"))
+    return sq_lines
+
+
+def read_sq_lines(target_file, opened=None):
+    """
+    Reads the @SQ lines of the header of a BAM, a CRAM or a SAM (plain or compressed), told apart by their first
+    bytes, so pipes and the standard input ("-") are read the same way as files.
+    Args:
+        target_file (str): path to the BAM, CRAM or SAM, or "-" for the standard input
+        opened (tuple | None): first bytes and stream of the file if already opened by inputs.open_input()
+
+    Returns:
+        the @SQ lines (list[str]) of the header
+    Raises:
+        ValueError if the file is neither a BAM, a CRAM nor a SAM, or its header can't be read
+        OSError if the file can't be opened
+    """
+    prefix, raw = opened or open_input(target_file)
+    with raw:
+        compression, content = content_prefix(prefix)
+        if content.startswith(BAM_MAGIC):
+            text = read_bam_header(raw)
+        elif prefix.startswith(CRAM_MAGIC):
+            text = read_cram_header(raw)
+        elif compression is not None:
+            # gzip and BGZF (a series of gzip members) inflated on demand, in this thread: the header is usually in
+            # the first block, so nothing is inflated ahead as the multi-threaded reader of bgzf.py would do
+            with gzip.GzipFile(fileobj=raw, mode="rb") as stream:
+                return read_text_sq_lines(io.TextIOWrapper(stream, encoding="utf-8", errors="replace"))
+        elif content.startswith(b"@"):
+            return read_text_sq_lines(io.TextIOWrapper(raw, encoding="utf-8", errors="replace"))
+        else:
+            raise ValueError("Not a BAM, CRAM or SAM file")
+    return [line for line in text.splitlines() if line.startswith("@SQ\t")]
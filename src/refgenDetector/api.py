@@ -0,0 +1,122 @@
+"""
+Python API of refgenDetector: infers the reference genome of headers, BAM/CRAM files, VCFs and PLINK variant files
+(.bim/.pvar) and returns an InferenceResult instead of printing. Nothing is printed and no state is kept between
+calls, so the functions can be called from several threads at the same time.
+
+    from refgenDetector.api import infer_header, infer_alignment, infer_vcf
+
+    result = infer_alignment("sample.cram")
+    print(result.species, result.version)
+
+The VCF and PLINK modules (NumPy) are imported by infer_vcf() and infer_plink() on their first call, so inferring
+headers and alignments doesn't pay for them.
+"""
+
+try:
+    # Works when installed as a pip package
+    from .aligment_files import comparison, process_data_bamcram, process_data_txt
+    from .results import InferenceResult, to_record
+except ImportError:
+    # Works when run directly as a script
+    from aligment_files import comparison, process_data_bamcram, process_data_txt
+    from results import InferenceResult, to_record
+
+ERROR_RATE = 1e-6  # variant_files.ERROR_RATE, not imported from it so importing the API doesn't load NumPy
+
+__all__ = ["InferenceResult", "infer_header", "infer_header_file", "infer_alignment", "infer_vcf", "infer_plink",
+           "to_record"]
+
+
+def infer_header(contigs, source="<contigs>"):
+    """
+    Infers the reference genome from the contigs of a header.
+    Args:
+        contigs (dict): contig names (key) and lengths (value), e.g. the SN and LN of the @SQ lines
+        source (str): name reported as file in the result
+
+    Returns:
+        result (InferenceResult) with the species, build, version and flavor inferred
+    """
+    dict_SN_LN = {str(name): int(length) for name, length in contigs.items()}
+    return comparison(dict_SN_LN, InferenceResult(source, "Contigs"))
+
+
+def infer_header_file(path):
+    """
+    Infers the reference genome from a BAM/CRAM header saved as text (plain or gzip).
+    Args:
+        path (str): path to the header
+
+    Returns:
+        result (InferenceResult) with the inference, AS and M5 values
+    """
+    return process_data_txt(path, InferenceResult(path, "BAM/CRAM header"))
+
+
+def infer_alignment(path):
+    """
+    Infers the reference genome from the header of a BAM or CRAM file.
+    Args:
+        path (str): path to the BAM or CRAM
+
+    Returns:
+        result (InferenceResult) with the inference, AS and M5 values
+    """
+    return process_data_bamcram(path, InferenceResult(path, "BAM/CRAM"))
+
+
+def infer_vcf(path, n_matches=5000, max_n_var=None, use_index=True, threads=None, error_rate=ERROR_RATE):
+    """
+    Infers the reference genome of a VCF, from the contigs of its header and from its REF column.
+    Args:
+        path (str): path to the VCF (vcf or vcf.gz) or BCF
+        n_matches (int | None): stop reading once this number of matches is reached. If None, read all variants.
+        max_n_var (int | None): stop reading once this number of variants is read. If None, read all variants.
+        use_index (bool): sample a bgzipped VCF with a tabix/CSI index through windows of the index instead of
+            reading it from the start
+        threads (int | None): threads decompressing a bgzipped VCF or a BCF, up to 4 by default
+        error_rate (float | None): stop reading once the version with most matches holds more than 50% of them with
+            at most this probability of error. If None, only n_matches and max_n_var stop the scan.
+
+    Returns:
+        result (InferenceResult) with the inference from the header and from the REF column and its confidence
+
+    Raises:
+        OSError: if the file can't be opened
+    """
+    try:
+        # Works when installed as a pip package
+        from .variant_files import open_vcf
+    except ImportError:
+        # Works when run directly as a script
+        from variant_files import open_vcf
+    return open_vcf(path, n_matches, max_n_var, InferenceResult(path, "VCF"), use_index=use_index,
+                    threads=threads, error_rate=error_rate)
+
+
+def infer_plink(path, n_matches=5000, max_n_var=None, threads=None, error_rate=ERROR_RATE):
+    """
+    Infers the reference genome of a PLINK variant file from both alleles of its SNPs (and from the ##contig lines of
+    a .pvar).
+    Args:
+        path (str): path to the .bim or .pvar (plain or .gz)
+        n_matches (int | None): stop reading once this number of matches is reached. If None, read all variants.
+        max_n_var (int | None): stop reading once this number of variants is read. If None, read all variants.
+        threads (int | None): threads decompressing a bgzipped file, up to 4 by default
+        error_rate (float | None): stop reading once the version with most matches holds more than 50% of them with
+            at most this probability of error. If None, only n_matches and max_n_var stop the scan.
+
+    Returns:
+        result (InferenceResult) with the inference from the alleles and its confidence
+
+    Raises:
+        OSError: if the file can't be opened
+    """
+    try:
+        # Works when installed as a pip package
+        from .plink_files import open_plink
+    except ImportError:
+        # Works when run directly as a script
+        from plink_files import open_plink
+    return open_plink(path, n_matches, max_n_var, InferenceResult(path, "BIM"), threads=threads,
+                      error_rate=error_rate)
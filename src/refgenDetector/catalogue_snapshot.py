@@ -0,0 +1,208 @@
+"""
+Compiled snapshot of the reference catalogue.
+
+The built-in references (reference_genome_dictionaries.py) and the custom ones added with refgenDetector-manager are
+compiled into one binary file holding the contig length index, the shortest contig of every reference and the GRCh37
+flavors. At startup the file is memory mapped and searched in place, so the 800 lines of literal dictionaries are not
+executed and every process of a node shares the same read-only pages.
+
+The snapshot is only written by refgenDetector-manager (build-snapshot, add and remove), never at startup. Loading it
+checks its header, its size and the size and modification time of its sources, without reading them; the sha256 of
+the payload is only compared by check-tables --full.
+
+Layout, header and sections in native byte order (the arrays are mapped as they are written), which is part of the
+fingerprint, so a snapshot copied to a machine of the other byte order is outdated there:
+    header    magic, format version, section sizes, sha256 of the payload, fingerprint of the sources (stat only)
+    lengths   n_lengths x uint64, sorted
+    offsets   (n_lengths + 1) x uint32, first entry of each length
+    entries   n_entries x 2 x uint32, (reference id, contig id)
+    names     (n_contigs + 1) x uint32 offsets followed by the utf-8 contig names
+    metadata  JSON: references as [group, build, species, rank, min_length], indexed by reference id
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+SNAPSHOT_FORMAT_VERSION = 2
+SNAPSHOT_MAGIC = b"RGDCATLG"
+HEADER = struct.Struct("=8sI4x5Q32s32s")  # magic, version, n_lengths, n_entries, n_contigs, names, metadata, hashes
+
+CONFIG_DIR = Path.home() / ".refgenDetector"
+CUSTOM_DB = CONFIG_DIR / "custom_references.json"
+DICTIONARIES_FILE = Path(__file__).resolve().parent / "reference_genome_dictionaries.py"
+
+
+def snapshot_path():
+    """
+    Path of the snapshot: $REFGENDETECTOR_SNAPSHOT if set (e.g. a path shared by all the nodes), otherwise
+    ~/.refgenDetector/catalogue.snapshot
+    """
+    return Path(os.environ.get("REFGENDETECTOR_SNAPSHOT", CONFIG_DIR / "catalogue.snapshot"))
+
+
+def file_stamp(path):
+    """
+    Size and modification time (ns) of a file, "-" if it doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "-"
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def source_fingerprint():
+    """
+    Hash of what the snapshot is compiled from: the format version, the byte order and the size and modification
+    time of the built-in dictionaries and of the custom references. The files are not read, so checking a snapshot
+    costs two stat calls. A snapshot with another fingerprint is outdated.
+    """
+    stamps = [str(SNAPSHOT_FORMAT_VERSION), sys.byteorder, file_stamp(DICTIONARIES_FILE), file_stamp(CUSTOM_DB)]
+    return hashlib.sha256(":".join(stamps).encode()).digest()
+
+
+def compile_snapshot(length_index, path=None):
+    """
+    Writes a length index, as created by length_index.build_length_index(), to a snapshot file. The file is written
+    next to the final path and renamed, so processes reading the previous snapshot are not affected.
+    Args:
+        length_index (dict): index to compile
+        path (str | Path): output path, snapshot_path() by default
+
+    Returns:
+        path (Path) of the snapshot written
+    """
+    path = Path(path) if path is not None else snapshot_path()
+
+    references = []
+    reference_ids = {}
+    for group, builds in length_index["references"].items():
+        for build, data in builds.items():
+            reference_ids[(group, build)] = len(references)
+            references.append([group, build, data["species"], data["rank"], data["min_length"]])
+
+    lengths = array("Q")
+    offsets = array("I")
+    entries = array("I")
+    contig_ids = {}
+    names = bytearray()
+    name_offsets = array("I", [0])
+    for ln in sorted(length_index["lengths"]):
+        lengths.append(ln)
+        offsets.append(len(entries) // 2)
+        for group, build, contig in length_index["lengths"][ln]:
+            if contig not in contig_ids:
+                contig_ids[contig] = len(contig_ids)
+                names += contig.encode()
+                name_offsets.append(len(names))
+            entries.extend((reference_ids[(group, build)], contig_ids[contig]))
+    offsets.append(len(entries) // 2)
+
+    metadata = json.dumps({"references": references}).encode()
+    payload = b"".join([lengths.tobytes(), offsets.tobytes(), entries.tobytes(), name_offsets.tobytes(),
+                        bytes(names), metadata])
+    header = HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(lengths), len(entries) // 2, len(contig_ids),
+                         len(names), len(metadata), hashlib.sha256(payload).digest(), source_fingerprint())
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as snapshot:
+        snapshot.write(header)
+        snapshot.write(payload)
+    os.replace(tmp_path, path)
+    return path
+
+
+class MappedLengths:
+    """
+    Read-only view of the lengths of a snapshot, with the same get() as the "lengths" dictionary of an index built
+    in memory: get(ln) returns the (group, build, contig) entries carrying that length.
+    """
+
+    def __init__(self, lengths, offsets, entries, name_offsets, names, references):
+        self.lengths = lengths
+        self.offsets = offsets
+        self.entries = entries
+        self.name_offsets = name_offsets
+        self.names = names
+        self.references = references
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __contains__(self, ln):
+        i = bisect_left(self.lengths, ln)
+        return i < len(self.lengths) and self.lengths[i] == ln
+
+    def contig_name(self, contig_id):
+        return bytes(self.names[self.name_offsets[contig_id]:self.name_offsets[contig_id + 1]]).decode()
+
+    def get(self, ln, default=None):
+        if not isinstance(ln, int) or not 0 <= ln < 2 ** 64:
+            return default
+        i = bisect_left(self.lengths, ln)
+        if i == len(self.lengths) or self.lengths[i] != ln:
+            return default
+        found = []
+        for entry in range(self.offsets[i], self.offsets[i + 1]):
+            group, build = self.references[self.entries[2 * entry]][:2]
+            found.append((group, build, self.contig_name(self.entries[2 * entry + 1])))
+        return found
+
+
+def load_snapshot(path=None, full=False):
+    """
+    Memory maps a snapshot and checks it can be used: its header, the size of its sections and the fingerprint of
+    its sources.
+    Args:
+        path (str | Path): snapshot to load, snapshot_path() by default
+        full (bool): also compare the sha256 of the payload, which reads the whole file
+
+    Returns:
+        length_index (dict) with the same structure as length_index.build_length_index(), or None if the snapshot
+        doesn't exist, is truncated (or corrupted, with full) or was compiled from other sources or by another
+        version of the tool
+    """
+    path = Path(path) if path is not None else snapshot_path()
+    try:
+        with open(path, "rb") as snapshot:
+            mapped = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapped) < HEADER.size:
+        return None
+
+    (magic, version, n_lengths, n_entries, n_contigs, names_size, metadata_size, checksum,
+     fingerprint) = HEADER.unpack_from(mapped)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT_VERSION or fingerprint != source_fingerprint():
+        return None
+    payload = memoryview(mapped)[HEADER.size:]
+    if full and hashlib.sha256(payload).digest() != checksum:
+        return None
+
+    sections = {}
+    start = 0
+    for name, size in [("lengths", 8 * n_lengths), ("offsets", 4 * (n_lengths + 1)), ("entries", 8 * n_entries),
+                       ("name_offsets", 4 * (n_contigs + 1)), ("names", names_size), ("metadata", metadata_size)]:
+        sections[name] = payload[start:start + size]
+        start += size
+    if start != len(payload):
+        return None
+
+    references = json.loads(bytes(sections["metadata"]))["references"]
+    mapped_lengths = MappedLengths(sections["lengths"].cast("Q"), sections["offsets"].cast("I"),
+                                   sections["entries"].cast("I"), sections["name_offsets"].cast("I"),
+                                   sections["names"], references)
+    length_index = {"lengths": mapped_lengths, "references": {}}
+    for group, build, species, rank, min_length in references:
+        length_index["references"].setdefault(group, {})[build] = {"species": species, "rank": rank,
+                                                                   "min_length": min_length}
+    return length_index
+
@@ -5,13 +5,15 @@ Handles two installation scenarios:
   1. Cloned from GitHub: moves + decompresses .xz files from github_msgpacks/
   2. Installed via pip: downloads github_msgpacks/ from GitHub, then moves + decompresses.
 
-Runs only once — skips everything if msgpacks/ already contains .msgpack files.
+Called on every import, it runs only once — skips everything, silently, if msgpacks/ already contains .msgpack files.
+The progress of the first setup is printed to the standard error, so jsonl/tsv output stays clean.
+
+The msgpacks are converted into the reference tables memory mapped by the VCF inference (tables/) by
+ref_manager build-tables, or by variant_tables.load_table() the first time a VCF needs them.
 """
 
-import lzma
+import sys
 import shutil
-import urllib.request
-import urllib.error
 import json
 from pathlib import Path
 
@@ -55,20 +57,24 @@ def get_paths():
 
 # HELPERS
 
+def log(message: str) -> None:
+    """Print the progress of the setup to the standard error, never mixed with the results."""
+    print(message, file=sys.stderr)
+
+
 def is_already_setup(dst: Path) -> bool:
     """Return True if at least one .msgpack file exists in dst."""
-    print(dst)
-    if not dst.exists():
-        return False
-    return any(dst.glob("*.msgpack"))
+    return dst.exists() and any(dst.glob("*.msgpack"))
 
 
 def decompress_xz(src_file: Path, dst_dir: Path) -> None:
     """Decompress a single .xz file into dst_dir, keeping the base name."""
     # e.g. foo.msgpack.xz  ->  dst_dir/foo.msgpack
+    import lzma
+
     out_name = src_file.stem  # strips the last suffix (.xz)
     out_path = dst_dir / out_name
-    print(f"  Decompressing {src_file.name} -> {out_path.name}")
+    log(f"  Decompressing {src_file.name} -> {out_path.name}")
     with lzma.open(src_file, "rb") as f_in, open(out_path, "wb") as f_out:
         shutil.copyfileobj(f_in, f_out)
 
@@ -78,17 +84,20 @@ def move_and_decompress(src_dir: Path, dst_dir: Path) -> None:
     dst_dir.mkdir(parents=True, exist_ok=True)
     xz_files = list(src_dir.glob("*.xz"))
     if not xz_files:
-        print(f"  WARNING: no .xz files found in {src_dir}")
+        log(f"  WARNING: no .xz files found in {src_dir}")
         return
     for xz_file in xz_files:
         decompress_xz(xz_file, dst_dir)
-    print(f"  Done — {len(xz_files)} file(s) decompressed into {dst_dir}")
+    log(f"  Done — {len(xz_files)} file(s) decompressed into {dst_dir}")
 
 
 # DOWNLOAD LOGIC
 
 def _github_api_request(url: str) -> list:
     """Fetch JSON from the GitHub contents API."""
+    import urllib.request
+    import urllib.error
+
     req = urllib.request.Request(url, headers={"User-Agent": "refgenDetector-installer"})
     try:
         with urllib.request.urlopen(req, timeout=30) as resp:
@@ -102,7 +111,9 @@ def _github_api_request(url: str) -> list:
 
 def download_github_msgpacks(dst_dir: Path) -> None:
     """Download every .xz file from the GitHub folder into dst_dir."""
-    print(f"  Fetching file list from GitHub …")
+    import urllib.request
+
+    log(f"  Fetching file list from GitHub …")
     entries = _github_api_request(GITHUB_API_URL)
 
     xz_entries = [e for e in entries if e["name"].endswith(".xz")]
@@ -113,12 +124,12 @@ def download_github_msgpacks(dst_dir: Path) -> None:
     for entry in xz_entries:
         raw_url  = f"{GITHUB_RAW_BASE}/{entry['name']}"
         out_path = dst_dir / entry["name"]
-        print(f"  Downloading {entry['name']} ({entry.get('size', '?')} bytes) …")
+        log(f"  Downloading {entry['name']} ({entry.get('size', '?')} bytes) …")
         req = urllib.request.Request(raw_url, headers={"User-Agent": "refgenDetector-installer"})
         with urllib.request.urlopen(req, timeout=120) as resp, open(out_path, "wb") as f:
             shutil.copyfileobj(resp, f)
 
-    print(f"  Downloaded {len(xz_entries)} file(s).")
+    log(f"  Downloaded {len(xz_entries)} file(s).")
 
 
 # MAIN
@@ -128,19 +139,18 @@ def run():
 
     # Check if the reference files have already been downloaded and decompressed
     if is_already_setup(dst):
-        print("[refgenDetector] Reference files already present — skipping setup.")
         return
 
-    print("[refgenDetector] Setting up reference files - This will only run once")
+    log("[refgenDetector] Setting up reference files - This will only run once")
 
     # Intallation done by clonning the repo - github_msgpacks/ is already present
     if src_clone.exists() and any(src_clone.glob("*.xz")):
-        print(f"  Detected clone install — using local {src_clone.name}/")
+        log(f"  Detected clone install — using local {src_clone.name}/")
         move_and_decompress(src_clone, dst)
 
     # Installation done via pip — need to download from GitHub and decompress 
     else:
-        print("  Detected pip install — downloading from GitHub …")
+        log("  Detected pip install — downloading from GitHub …")
         try:
             download_github_msgpacks(src_pip)
             move_and_decompress(src_pip, dst)
@@ -149,7 +159,7 @@ def run():
             if src_pip.exists():
                 shutil.rmtree(src_pip, ignore_errors=True)
 
-    print("[refgenDetector] Reference files ready.\n")
+    log("[refgenDetector] Reference files ready.\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,209 @@
+"""
+Inputs given as a path, a named pipe or the standard input ("-"), e.g.
+
+    samtools view -H sample.cram | refgenDetector -t Header -f -
+    bcftools view -r chr21 cohort.bcf | refgenDetector -t VCF -f -
+
+A pipe can't be opened twice nor seeked, so its format can't be told from its name or by reading its start and
+opening it again. The first bytes of the input are read once (open_input()), the format is told apart from them
+(content_prefix(): gzip, BGZF and the first bytes of the uncompressed content) and they are given back to the parser
+in front of the rest of the stream.
+
+Files are opened the same way, once: their container, compression and text encoding are told apart from the first
+bytes instead of trying to open them again on each error, and without --type the parser of each file is chosen by
+sniff_type().
+"""
+
+import codecs
+import io
+import os
+import stat
+import sys
+import threading
+import zlib
+
+try:
+    # Works when installed as a pip package
+    from .bgzf import read_block, inflate_blocks, is_bgzf_header
+except ImportError:
+    # Works when run directly as a script
+    from bgzf import read_block, inflate_blocks, is_bgzf_header
+
+STDIN = "-"
+PREFIX_BYTES = 1 << 16  # the largest BGZF block, so the first block of a BGZF input is always in the prefix
+GZIP_MAGIC = b"\x1f\x8b"
+BAM_MAGIC = b"BAM\x01"
+CRAM_MAGIC = b"CRAM"
+BCF_MAGIC = b"BCF\x02"
+VCF_MAGIC = b"##fileformat=VCF"
+VCF_HEADER = ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO"]
+PVAR_HEADER = {"#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "CM"}  # the columns PLINK 2 writes
+PIPE_BYTES = 1 << 20
+
+
+def is_stream(target_file):
+    """
+    True for the standard input ("-") and named pipes: read once from the start, without seeking nor an index.
+    """
+    if target_file == STDIN:
+        return True
+    try:
+        return stat.S_ISFIFO(os.stat(target_file).st_mode)
+    except OSError:
+        return False
+
+
+class PrefixedReader(io.RawIOBase):
+    """
+    Binary stream with the bytes already read from an input followed by the rest of it.
+    """
+
+    def __init__(self, prefix, raw, close_raw=True):
+        super().__init__()
+        self._prefix = memoryview(prefix)
+        self._raw = raw
+        self._close_raw = close_raw
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            n = min(len(buffer), len(self._prefix))
+            buffer[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._raw.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed and self._close_raw:
+            self._raw.close()
+        super().close()
+
+
+def open_input(target_file, prefix_bytes=PREFIX_BYTES):
+    """
+    Opens a path, a named pipe or the standard input ("-") and reads its first bytes.
+    Args:
+        target_file (str): path of the input, or "-" for the standard input
+        prefix_bytes (int): bytes read to tell the format apart
+
+    Returns:
+        the first bytes (bytes) and a binary stream from the start of the input, those bytes included. Closing the
+        stream doesn't close the standard input.
+    Raises:
+        OSError if the file can't be opened
+    """
+    raw = sys.stdin.buffer if target_file == STDIN else open(target_file, "rb")
+    prefix = raw.read(prefix_bytes)
+    return prefix, io.BufferedReader(PrefixedReader(prefix, raw, close_raw=target_file != STDIN), 1 << 20)
+
+
+def content_prefix(prefix):
+    """
+    Tells apart the compression of an input from its first bytes.
+    Args:
+        prefix (bytes): first bytes of the input, see open_input()
+
+    Returns:
+        compression (str | None): "bgzf", "gzip" or None, and the first bytes of the uncompressed content (those of
+        the first block for BGZF, those inflated from the first bytes for gzip)
+    """
+    if is_bgzf_header(prefix):
+        try:
+            return "bgzf", inflate_blocks([read_block(io.BytesIO(prefix))])
+        except OSError:
+            return "bgzf", b""
+    if prefix.startswith(GZIP_MAGIC):
+        try:
+            return "gzip", zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(prefix)
+        except zlib.error:
+            return "gzip", b""
+    return None, prefix
+
+
+def text_encoding(content):
+    """
+    Encoding of a text input from its first bytes: utf-8 if they are valid UTF-8 (a character cut at the end
+    included), iso-8859-1 otherwise.
+    """
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(content, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "iso-8859-1"
+
+
+def sniff_type(prefix):
+    """
+    Type of an input, one of the values of --type, told apart from its first bytes:
+
+        BAM/CRAM  a BAM ("BAM\\1" in its first BGZF block) or a CRAM ("CRAM")
+        VCF       a BCF ("BCF\\2"), a VCF (##fileformat=VCF), a VCF without ##fileformat (the VCF columns in the
+                  #CHROM line, or other ## lines before it or without one in the prefix), or a VCF without header
+                  lines (8 or more columns in the first line)
+        Header    a header saved as text or a SAM (a line starting with @)
+        BIM       a .pvar (a #CHROM line with the columns of PLINK 2 only, after ## lines or not) or a .bim (6
+                  columns, the fourth one a position)
+
+    Plain, gzip and bgzip compressed text is told apart alike.
+    Args:
+        prefix (bytes): first bytes of the input, see open_input()
+
+    Returns:
+        the type (str), or None if the input isn't any of them
+    """
+    _, content = content_prefix(prefix)
+    if content.startswith(BAM_MAGIC) or prefix.startswith(CRAM_MAGIC):
+        return "BAM/CRAM"
+    if content.startswith((BCF_MAGIC, VCF_MAGIC)):
+        return "VCF"
+    if content.startswith(b"@"):
+        return "Header"
+    lines = content.split(b"\n")
+    if content.startswith(b"#"):
+        chrom_line = next((line for line in lines if line.startswith(b"#CHROM\t")), None)
+        if chrom_line is not None:
+            columns = chrom_line.rstrip(b"\r").decode("utf-8", "replace").split("\t")
+            if columns[:len(VCF_HEADER)] == VCF_HEADER:
+                return "VCF"
+            if set(columns) <= PVAR_HEADER and {"POS", "REF", "ALT"} <= set(columns):
+                return "BIM"
+        # Other ## lines (or a #CHROM line not reached in the prefix) are those of a VCF without ##fileformat
+        return "VCF" if content.startswith(b"##") else None
+    fields = lines[0].rstrip(b"\r").decode("utf-8", "replace").split("\t")
+    if len(fields) == 6 and fields[3].isdigit():
+        return "BIM"
+    if len(fields) >= 8 and fields[1].isdigit():
+        return "VCF"
+    return None
+
+
+def pipe_to_fd(stream):
+    """
+    Copies a stream, in another thread, into a pipe whose reading end is returned as a file descriptor, so htslib
+    (pysam) reads an input whose first bytes were already read by Python. The copy stops when the reading end is
+    closed.
+    Returns:
+        the file descriptor (int) of the reading end, owned by the caller
+    """
+    read_fd, write_fd = os.pipe()
+
+    def copy():
+        try:
+            while True:
+                data = stream.read(PIPE_BYTES)
+                if not data:
+                    break
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(write_fd, view):]
+        except (BrokenPipeError, ValueError):
+            pass  # the reader stopped early (or the stream was closed)
+        finally:
+            os.close(write_fd)
+
+    threading.Thread(target=copy, daemon=True).start()
+    return read_fd
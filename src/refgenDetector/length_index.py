@@ -0,0 +1,123 @@
+try:
+    # Works when installed as a pip package
+    from .catalogue_snapshot import load_snapshot
+except ImportError:
+    # Works when run directly as a script
+    from catalogue_snapshot import load_snapshot
+
+
+def add_reference_to_index(length_index, group, build, species, ref_gen):
+    """
+    Adds the contigs of one reference to the index, keeping the order in which the references are added.
+    Args:
+        length_index (dict): index being built by build_length_index()
+        group (str): catalogue the reference belongs to ("major", "flavors_GRCh37", "verily" or "mit")
+        build (str): build of the reference
+        species (str): species of the reference
+        ref_gen (dict): contigs of the reference (contig name: key, length: value)
+    """
+    references = length_index["references"].setdefault(group, {})
+    references[build] = {"species": species, "rank": len(references), "min_length": min(ref_gen.values())}
+    for contig, ln in ref_gen.items():
+        length_index["lengths"].setdefault(ln, []).append((group, build, contig))
+
+
+def build_length_index(releases=None, flavors=None, verily=None, mitochondrial=None):
+    """
+    Builds, once, an inverted index from contig length to every reference contig carrying that length. With it a
+    header is resolved in one pass over its own contigs instead of intersecting it with every reference.
+    Args:
+        releases (dict): major releases, major_releases by default (custom references included)
+        flavors (dict): GRCh37 flavors, flavors_GRCh37 by default
+        verily (dict): lengths unique to GRCh38_no_alt_plus_hs38d1, verily_difGRCh38 by default
+        mitochondrial (dict): mitochondrial contigs, mit_contigs by default
+
+    Returns:
+        length_index (dict): "lengths" maps each length to a list of (group, build, contig) entries, "references"
+        maps each group to its builds (in catalogue order) with their species, rank and shortest contig.
+    """
+    try:
+        # Works when installed as a pip package
+        from . import reference_genome_dictionaries as catalogue
+    except ImportError:
+        # Works when run directly as a script
+        import reference_genome_dictionaries as catalogue
+
+    releases = catalogue.major_releases if releases is None else releases
+    flavors = catalogue.flavors_GRCh37 if flavors is None else flavors
+    verily = catalogue.verily_difGRCh38 if verily is None else verily
+    mitochondrial = catalogue.mit_contigs if mitochondrial is None else mitochondrial
+
+    length_index = {"lengths": {}, "references": {}}
+    for reference in releases.values():
+        add_reference_to_index(length_index, "major", reference["build"], reference["species"], reference["ref_gen"])
+    for reference in flavors.values():
+        add_reference_to_index(length_index, "flavors_GRCh37", reference["build"], reference["species"],
+                               reference["ref_gen"])
+    add_reference_to_index(length_index, "verily", "GRCh38_no_alt_plus_hs38d1", "Homo sapiens", verily)
+    for contig, ln in mitochondrial.items():
+        add_reference_to_index(length_index, "mit", contig, "Homo sapiens", {contig: ln})
+    return length_index
+
+
+def lookup_lengths(dict_SN_LN, length_index):
+    """
+    Single pass over the contigs of the target file, collecting the lengths matching each reference of the index.
+    Args:
+        dict_SN_LN (dict): dictionary with the contig (SN: key, LN: value) info from the target file
+        length_index (dict): index created by build_length_index()
+
+    Returns:
+        hits (dict): {group: {build: set of matching lengths}} with only the references having at least one match
+    """
+    hits = {}
+    lengths = length_index["lengths"]
+    for ln in set(dict_SN_LN.values()):
+        for group, build, _ in lengths.get(ln, ()):
+            hits.setdefault(group, {}).setdefault(build, set()).add(ln)
+    return hits
+
+
+def ranked_matches(hits, group, length_index):
+    """
+    Orders the matches of one group as the references are ordered in the catalogue, so ties are resolved as when
+    every reference was intersected one after the other.
+    Args:
+        hits (dict): output of lookup_lengths()
+        group (str): group of references to rank
+        length_index (dict): index created by build_length_index()
+
+    Returns:
+        matches_info (list): list of tuples (matching lengths, build, species), only for the references with matches
+    """
+    references = length_index["references"][group]
+    group_hits = hits.get(group, {})
+    ordered = sorted(group_hits, key=lambda build: references[build]["rank"])
+    return [(group_hits[build], build, references[build]["species"]) for build in ordered]
+
+
+def contigs_with_length(ln, group, build, length_index):
+    """
+    Returns the names of the contigs of a reference with the given length.
+    """
+    return [contig for entry_group, entry_build, contig in length_index["lengths"].get(ln, ())
+            if entry_group == group and entry_build == build]
+
+
+def load_length_index():
+    """
+    Loads the index from the compiled snapshot of the catalogue (see catalogue_snapshot.py). If there is no valid
+    snapshot, e.g. before running refgenDetector-manager build-snapshot or after editing the dictionaries, the index
+    is built in memory from the dictionaries. Nothing is written: the snapshot is only compiled by
+    refgenDetector-manager.
+
+    Returns:
+        length_index (dict): same structure as build_length_index()
+    """
+    length_index = load_snapshot()
+    if length_index is None:
+        length_index = build_length_index()
+    return length_index
+
+
+LENGTH_INDEX = load_length_index()
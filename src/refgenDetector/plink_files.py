@@ -0,0 +1,124 @@
+"""
+Inference of the reference genome of PLINK variant files: .bim (PLINK 1) and .pvar (PLINK 2), plain or gzip/bgzip
+compressed.
+
+The files are streamed through the same tokenizer and matcher as VCFs (see vcf_tokenizer.py and variant_files.py).
+A .bim has no header and its columns are chromosome, ID, cM, position, A1 and A2. A .pvar has a VCF-like header
+(#CHROM POS ID REF ALT ...), which gives the columns, and may have ##contig lines, used as in a VCF; without a
+#CHROM line its columns are the ones of a .bim. A1/A2 (and often the REF of a .pvar, written as "provisional" when
+converted from a .bim) are not guaranteed to be the reference allele, so both alleles of every SNP are matched.
+"""
+
+try:
+    # Works when installed as a pip package
+    from .chromosomes_dict import chromosome_map
+    from .results import InferenceResult
+    from .variant_files import VariantInference, scan_records, start_refgen_header, chunk_memory_bytes, ERROR_RATE
+    from .vcf_tokenizer import read_records, BIM_COLUMNS
+    from .bgzf import open_compressed, is_bgzf
+    from .inputs import is_stream, open_input, content_prefix
+except ImportError:
+    # Works when run directly as a script
+    from chromosomes_dict import chromosome_map
+    from results import InferenceResult
+    from variant_files import VariantInference, scan_records, start_refgen_header, chunk_memory_bytes, ERROR_RATE
+    from vcf_tokenizer import read_records, BIM_COLUMNS
+    from bgzf import open_compressed, is_bgzf
+    from inputs import is_stream, open_input, content_prefix
+
+# PLINK codes of X, Y and the pseudo-autosomal region of X (XY, on the coordinates of X)
+PLINK_CHROMOSOMES = {"23": "chrX", "24": "chrY", "25": "chrX", "XY": "chrX", "chrXY": "chrX"}
+PVAR_COLUMNS = ("CHROM", "POS", "REF", "ALT")
+
+
+def plink_chromosomes():
+    """
+    Chromosome names of PLINK files to the names of the tables: the names of VCFs and the PLINK numeric codes.
+    """
+    return {**chromosome_map, **PLINK_CHROMOSOMES}
+
+
+def read_pvar_header(stream, result):
+    """
+    Reads the header of a .pvar: the ## lines (contigs, used to infer the reference genome as in a VCF) and the
+    #CHROM line, which gives the columns of CHROM, POS, REF and ALT.
+    Args:
+        stream: opened binary stream at the start of the file
+        result (InferenceResult): result of the file, filled with the inference from the contigs of the header
+    Returns:
+        columns (tuple[int]) of CHROM, POS, REF and ALT, BIM_COLUMNS if there's no #CHROM line, and the first
+        record (bytes) read after the header
+    Raises:
+        ValueError if the #CHROM line lacks one of the columns
+    """
+    header = []
+    columns = BIM_COLUMNS
+    first_record = b""
+    for line in stream:
+        if line.startswith(b"##"):
+            header.append(line.decode("utf-8", "replace").strip())
+        elif line.startswith(b"#"):
+            names = line.decode("utf-8", "replace").strip().lstrip("#").split("\t")
+            missing = [name for name in PVAR_COLUMNS if name not in names]
+            if missing:
+                raise ValueError(f"The #CHROM line of the pvar has no {', '.join(missing)} column.")
+            columns = tuple(names.index(name) for name in PVAR_COLUMNS)
+        else:
+            first_record = line
+            break
+    if header:
+        start_refgen_header(header, result)
+    return columns, first_record
+
+
+def open_plink(input_file, n_matches, max_n_var, result=None, verbose=False, threads=None, error_rate=ERROR_RATE,
+               opened=None):
+    """
+    Infers the reference genome of a .bim or .pvar (plain, .gz or bgzipped .gz) from the alleles of its SNPs.
+    Args:
+        input_file (str): path of the input file, a named pipe or "-" for the standard input
+        n_matches (int | None): stop reading once the total number of matches exceeds this value
+        max_n_var (int | None): stop reading once this number of variants is read
+        result (InferenceResult): result of the input file, created if not given
+        verbose (bool): print the progress of the scan (interactive mode)
+        threads (int | None): threads inflating a bgzipped file, bgzf.default_threads() if None
+        error_rate (float | None): stop reading once the inferred version is wrong with at most this probability
+        opened (tuple | None): first bytes and stream of the file if already opened by inputs.open_input(). Its
+            compression and layout (.bim or .pvar) are then told apart from its content, as for a pipe.
+
+    Returns:
+        result (InferenceResult) with the reference genome inferred from the alleles (and from the ##contig lines
+        of a .pvar)
+    """
+    if result is None:
+        result = InferenceResult(input_file, "BIM")
+
+    stream_input = opened is not None or is_stream(input_file)
+    compressed = input_file.endswith(".gz")
+    name = input_file[:-3] if compressed else input_file
+    if not stream_input and not name.endswith((".bim", ".pvar")):
+        result.status = "error"
+        result.message = "Only Formats Allowed: bim, pvar, bim.gz and pvar.gz"
+        return result
+
+    session = VariantInference(result, n_matches, max_n_var, error_rate, both_alleles=True,
+                               chromosomes=plink_chromosomes())
+    if stream_input:
+        prefix, raw = opened or open_input(input_file)
+        compression = content_prefix(prefix)[0]
+    else:
+        raw = open(input_file, "rb")
+        compression = ("bgzf" if is_bgzf(input_file) else "gzip") if compressed else None
+    with raw, (open_compressed(raw, threads, "rb", compression == "bgzf") if compression else raw) as stream:
+        # Without an extension to rely on (a pipe, or a file sniffed), a .pvar is told apart by its header
+        pvar = stream.peek(1)[:1] == b"#" if stream_input else name.endswith(".pvar")
+        columns, first_record = BIM_COLUMNS, b""
+        if pvar:
+            try:
+                columns, first_record = read_pvar_header(stream, result)
+            except ValueError as e:
+                result.variant_status = "error"
+                result.variant_message = str(e)
+                return session.finish()
+        chunks = read_records(stream, session.chrom_names, chunk_memory_bytes(), first_record, max_n_var, columns)
+        return scan_records(chunks, session, verbose)
@@ -4,14 +4,16 @@ from pathlib import Path
 try:
     # Works when installed as a pip package
     from .reference_genome_dictionaries import *
+    from .catalogue_snapshot import CUSTOM_DB, compile_snapshot, load_snapshot, snapshot_path
+    from .table_manifest import MSGPACK_DIR, TABLES_DIR, validate_tables
 except ImportError:
     # Works when run directly as a script
     from reference_genome_dictionaries import *
+    from catalogue_snapshot import CUSTOM_DB, compile_snapshot, load_snapshot, snapshot_path
+    from table_manifest import MSGPACK_DIR, TABLES_DIR, validate_tables
 
 
-DEFAULT_MAJOR_RELEASES = dict(major_releases)
-
-CUSTOM_DB = Path.home() / ".refgenDetector" / "custom_references.json"
+DEFAULT_MAJOR_RELEASES = dict(default_releases)
 
 # make sure the directory exists
 CUSTOM_DB.parent.mkdir(parents=True, exist_ok=True)
@@ -77,7 +79,7 @@ def get_all_references():
         dict: A dictionary containing all references, where keys are reference names and values are their data.
     """
     custom = load_custom_db()
-    merged = dict(major_releases)
+    merged = dict(DEFAULT_MAJOR_RELEASES)
     merged.update(custom)
     return merged
 
@@ -155,6 +157,7 @@ def add_reference(ref_name, species, fai_file):
     save_custom_db(db)
 
     print(f"Reference '{ref_name}' added successfully.")
+    build_snapshot()
 
 
 def list_references():
@@ -196,14 +199,81 @@ def remove_reference(ref_name):
     save_custom_db(db)
 
     print(f"Removed reference '{ref_name}'")
+    build_snapshot()
+
+
+def build_snapshot(path=None):
+    """
+    Compiles the default and custom references into the binary snapshot memory mapped by refgenDetector at startup.
+    It runs automatically after add and remove. refgenDetector never writes it: without a valid snapshot the catalogue
+    is built in memory at every start.
+    Args:
+        path (str | None): output path. By default $REFGENDETECTOR_SNAPSHOT or ~/.refgenDetector/catalogue.snapshot
+    """
+    try:
+        # Works when installed as a pip package
+        from .length_index import build_length_index
+    except ImportError:
+        # Works when run directly as a script
+        from length_index import build_length_index
+
+    all_refs = get_all_references()
+    written = compile_snapshot(build_length_index(releases=all_refs), path)
+    print(f"Snapshot of {len(all_refs)} references written to {written}")
+
+
+def build_variant_tables():
+    """
+    Converts the msgpacks used with VCFs into the reference tables memory mapped by refgenDetector, and writes their
+    manifest (format version, rows, size and sha256 of every file).
+    """
+    try:
+        # Works when installed as a pip package
+        from .variant_tables import build_tables
+    except ImportError:
+        # Works when run directly as a script
+        from variant_tables import build_tables
+
+    if not Path(MSGPACK_DIR).is_dir():
+        raise FileNotFoundError(f"Directory not found: {MSGPACK_DIR}")
+    print(f"Converting the msgpacks in {MSGPACK_DIR}")
+    manifest = build_tables(MSGPACK_DIR, TABLES_DIR, verbose=True)
+    print(f"{len(manifest['tables'])} tables written to {TABLES_DIR}")
+
+
+def check_variant_tables(full=False):
+    """
+    Checks that the reference tables are complete and match this version of refgenDetector, and that the catalogue
+    snapshot, if any, is up to date.
+    Args:
+        full (bool): also compare the sha256 of every file and of the snapshot, not only their sizes
+
+    Returns:
+        True if the installation is valid
+    """
+    problems = validate_tables(MSGPACK_DIR, TABLES_DIR, full=full)
+    snapshot = snapshot_path()
+    if not snapshot.exists():
+        print(f"Note: no catalogue snapshot in {snapshot}, the catalogue is built in memory at every start "
+              f"(run build-snapshot)")
+    elif load_snapshot(snapshot, full=full) is None:
+        problems.append(f"The catalogue snapshot {snapshot} is outdated or corrupted (run build-snapshot)")
+    for problem in problems:
+        print(f"- {problem}")
+    if not problems:
+        print(f"The tables in {TABLES_DIR} are valid")
+    return not problems
 
 
 def main():
     """
-    Command-line interface for managing the reference database. It supports three commands:
+    Command-line interface for managing the reference database. It supports six commands:
         - add <name> <species> <fai>: Adds a new reference to the custom database with the specified name, species, and contig information loaded from the provided .fai file.
         - list: Lists all available references, including both default and custom ones, indicating their origin and the total number of references.
         - remove <name>: Removes a reference from the custom database by its name. Only references that were added to the custom database can be removed, default references cannot be removed.
+        - build-snapshot [path]: Compiles the default and custom references into the binary snapshot loaded at startup.
+        - build-tables: Converts the msgpacks used with VCFs into memory mapped tables and writes their manifest.
+        - check-tables [--full]: Checks the tables against their manifest and the catalogue snapshot, comparing sizes or, with --full, sha256.
     """
 
     if len(sys.argv) < 2:
@@ -211,7 +281,10 @@ def main():
             "Usage:\n"
             "  add <name> <species> <fai>\n"
             "  list\n"
-            "  remove <name>"
+            "  remove <name>\n"
+            "  build-snapshot [path]\n"
+            "  build-tables\n"
+            "  check-tables [--full]"
         )
         sys.exit(1)
 
@@ -234,6 +307,28 @@ def main():
 
         remove_reference(sys.argv[2])
 
+    elif command == "build-snapshot":
+        if len(sys.argv) > 3:
+            print("Usage: build-snapshot [path]")
+            sys.exit(1)
+
+        build_snapshot(sys.argv[2] if len(sys.argv) == 3 else None)
+
+    elif command == "build-tables":
+        if len(sys.argv) != 2:
+            print("Usage: build-tables")
+            sys.exit(1)
+
+        build_variant_tables()
+
+    elif command == "check-tables":
+        if len(sys.argv) > 3 or (len(sys.argv) == 3 and sys.argv[2] != "--full"):
+            print("Usage: check-tables [--full]")
+            sys.exit(1)
+
+        if not check_variant_tables(full=len(sys.argv) == 3):
+            sys.exit(1)
+
     else:
         print(f"Unknown command: {command}")
 
@@ -727,9 +727,11 @@ major_releases = {"hg16": {"ref_gen": hg16, "build": "hg16", "species": "Homo sa
                   "Sscrofa11_1": {"ref_gen": Sscrofa11_1, "build": "Sscrofa11_1", "species": "Sus scrofa"}
                   }
 
-## Add custom references if present 
+## Add custom references if present (added with refgenDetector-manager)
 
-CUSTOM_DB = Path("custom_references.json")
+default_releases = dict(major_releases) # built-in references, before adding the custom ones
+
+CUSTOM_DB = Path.home() / ".refgenDetector" / "custom_references.json"
 
 if CUSTOM_DB.exists():
     with open(CUSTOM_DB) as f:
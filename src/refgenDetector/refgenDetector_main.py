@@ -10,34 +10,67 @@ __status__ = "Developement"
 
 version = "3.0.6"
 
+# Only the modules needed by every run are imported here. pysam, psutil, Rich and the VCF module (numpy,
+# msgpack) are imported by the code paths that use them, so a header check doesn't pay for them at startup.
 import os
 import sys
 import argparse
-import gzip
-import pysam
-import psutil
+import collections
 import time
-from rich.console import Console
 try:
     # Works when installed as a pip package
-    from .reference_genome_dictionaries import *
-    from .exceptions.NoFileException import *
     from .aligment_files import *
-    from .variant_files import *
+    from .results import *
+    from .inputs import open_input, sniff_type
 except ImportError:
     # Works when run directly as a script
-    from reference_genome_dictionaries import *
-    from exceptions.NoFileException import *
     from aligment_files import *
-    from variant_files import *
+    from results import *
+    from inputs import open_input, sniff_type
 
-console = Console()
+_console = None
+
+# --type to the file type reported in the results
+FILE_TYPES = {"BAM/CRAM": "BAM/CRAM", "Header": "BAM/CRAM header", "VCF": "VCF", "BIM": "BIM"}
+
+
+def get_console():
+    """Rich console of the interactive mode, created on first use so jsonl/tsv runs never import Rich."""
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
+
+
+def load_variant_module():
+    """Imports the VCF module (numpy, msgpack) the first time a VCF is processed."""
+    try:
+        # Works when installed as a pip package
+        from . import variant_files
+    except ImportError:
+        # Works when run directly as a script
+        import variant_files
+    return variant_files
+
+
+def load_plink_module():
+    """Imports the PLINK module (and the VCF module it uses) the first time a .bim/.pvar is processed."""
+    try:
+        # Works when installed as a pip package
+        from . import plink_files
+    except ImportError:
+        # Works when run directly as a script
+        import plink_files
+    return plink_files
 
 
 
 def monitor_resources(func):
     """Decorator to print resource usage (CPU, memory, I/O, runtime)."""
     def wrapper(*args, **kwargs):
+        import psutil
+
         process = psutil.Process()
         start_time = time.time()
         start_cpu_time = process.cpu_times()
@@ -71,39 +104,155 @@ def monitor_resources(func):
     return wrapper
 
 
-def run_main(args):
-    """Main logic of the tool (isolated from CLI parsing)."""
-    console.print(f"[bold]* Running refgenDetector v.{version} *[/bold]")
-    console.print(f"---")
-    console.print(f"[bold]++ INFORMATION INFERRED BY THE HEADER ++[/bold]\n")
-    console.print(f"[bold]File:[/bold] {args.file}")
+def infer_file(target_file, args, verbose=False):
+    """
+    Runs the inference of a single file.
+    Args:
+        target_file (str): path to the file
+        args (argparse.Namespace): command line arguments
+        verbose (bool): print the progress of long scans (interactive mode with a single file)
+
+    Returns:
+        result (InferenceResult) of the file, with the time it took
+    """
+    start_time = time.perf_counter()
+    file_type, opened = args.type, None
+    result = InferenceResult(target_file, FILE_TYPES.get(file_type, "unknown"))
     try:
-        if args.type == "Header":  
-            console.print("[bold]File type:[/bold] BAM/CRAM header")  
-            process_data_txt(args.file, args.md5, args.assembly)
-        elif args.type in ["VCF"]:
-            console.print("[bold]File type:[/bold] VCF") 
-            open_vcf(args.file, args.matches, args.max_n_var)
-        else:
-            console.print("[bold]File type:[/bold] BAM/CRAM") 
-            process_data_bamcram(args.file, args.md5, args.assembly)
+        if file_type is None:
+            # Opened once: the parser goes on reading from the bytes read to tell the type apart
+            opened = open_input(target_file)
+            file_type = sniff_type(opened[0])
+            if file_type is None:
+                opened[1].close()
+                result.status = "error"
+                result.message = "The type of the file can't be told apart from its first bytes. Give it with --type."
+            else:
+                result.file_type = FILE_TYPES[file_type]
+        if file_type == "Header":
+            process_data_txt(target_file, result, opened)
+        elif file_type in ["VCF"]:
+            load_variant_module().open_vcf(target_file, args.matches, args.max_n_var, result, verbose,
+                                           use_index=not args.sequential, threads=args.threads,
+                                           error_rate=args.error_rate or None, opened=opened)
+        elif file_type == "BIM":
+            load_plink_module().open_plink(target_file, args.matches, args.max_n_var, result, verbose,
+                                           threads=args.threads, error_rate=args.error_rate or None, opened=opened)
+        elif file_type == "BAM/CRAM":
+            process_data_bamcram(target_file, result, opened)
     except OSError:
-        console.print(f"[red]The file {args.file} provided in --file can't be opened."
-                      f"\nRun [bold]refgenDetector -h[/bold] to get more information about the usage of the tool.")
-    console.print(f"---")
+        result.status = "error"
+        result.message = (f"The file {target_file} provided in --file can't be opened."
+                          f"\nRun refgenDetector -h to get more information about the usage of the tool.")
+    result.elapsed_seconds = time.perf_counter() - start_time
+    return result
+
+
+def infer_file_in_worker(target_file, args):
+    """
+    Runs the inference of a single file in a batch worker. Unexpected failures are reported in the result of the
+    file so the rest of the batch goes on.
+    """
+    try:
+        return infer_file(target_file, args)
+    except (Exception, SystemExit) as e:
+        return InferenceResult(target_file, FILE_TYPES.get(args.type, "unknown"), status="error",
+                               message=f"Unexpected error: {e}")
+
+
+def emit_result(result, args):
+    """
+    Prints the result of one file: with Rich in the interactive mode, or as one JSON Lines / TSV line.
+    """
+    if args.output_format == "rich":
+        print_result(result, get_console(), md5=args.md5, assembly=args.assembly)
+    else:
+        write_record(result, args.output_format, sys.stdout, md5=args.md5, assembly=args.assembly)
+
+
+def read_file_list(file_list):
+    """
+    Reads the manifest given in --file-list: one path per line, blank lines and lines starting with # are ignored.
+    """
+    with open(file_list) as manifest:
+        return [line.strip() for line in manifest if line.strip() and not line.startswith("#")]
+
+
+def run_batch(args):
+    """
+    Fans the files of the manifest out over a pool of --jobs worker processes. The workers are forked from this
+    process, so they share the reference index already loaded in memory. At most 2 * --jobs files are in flight
+    and the results are printed in the order of the manifest, one per file.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    target_files = read_file_list(args.file_list)
+    if args.type == "VCF":
+        load_variant_module()  # imported once here and shared by the forked workers
+    elif args.type == "BIM":
+        load_plink_module()
+    start_methods = multiprocessing.get_all_start_methods()
+    mp_context = multiprocessing.get_context("fork") if "fork" in start_methods else None
+
+    with ProcessPoolExecutor(max_workers=args.jobs, mp_context=mp_context) as executor:
+        in_flight = collections.deque()
+        for target_file in target_files:
+            in_flight.append(executor.submit(infer_file_in_worker, target_file, args))
+            if len(in_flight) >= 2 * args.jobs:
+                emit_result(in_flight.popleft().result(), args)
+        while in_flight:
+            emit_result(in_flight.popleft().result(), args)
+
+
+def run_main(args):
+    """Main logic of the tool (isolated from CLI parsing)."""
+    if args.output_format == "rich":
+        get_console().print(f"[bold]* Running refgenDetector v.{version} *[/bold]")
+        get_console().print(f"---")
+    elif args.output_format == "tsv":
+        sys.stdout.write(tsv_header())
+    if args.file_list:
+        run_batch(args)
+    else:
+        emit_result(infer_file(args.file, args, verbose=args.output_format == "rich"), args)
 
 def main():
     parser = argparse.ArgumentParser(prog="INFERRING THE REFERENCE GENOME USED TO ALIGN BAM OR CRAM FILE")
-    parser.add_argument("-f", "--file", help="Input file path", required=True)
-    parser.add_argument("-t", "--type", choices=["BAM/CRAM", "Header", "VCF", "BIM"], required=True,
-                        help="Type of files to analyze.")
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("-f", "--file", help="Input file path, a named pipe or - to read the standard input")
+    inputs.add_argument("-l", "--file-list", help="Text file with one input file path per line. The files are "
+                                                  "processed in parallel (see --jobs).")
+    parser.add_argument("-t", "--type", choices=["BAM/CRAM", "Header", "VCF", "BIM"],
+                        help="Type of files to analyze. If not given, the type of each file is told apart from its "
+                             "first bytes.")
     parser.add_argument("--md5", action="store_true", help="Print md5 values if present in header.")
     parser.add_argument("-a", "--assembly", action="store_true", help="Print assembly if present in header.")
-    parser.add_argument("-v", "--max_n_var", type=int, help="Maximum number of variants to read before stopping inference. The file is processed in chunks of 100,000 variants, so this value must be a multiple of 100,000 (e.g. 100000, 200000, 300000, ...).") 
+    parser.add_argument("-v", "--max_n_var", type=int, help="Maximum number of variants to read before stopping inference.") 
     parser.add_argument("-m", "--matches", type=int, default=5000, help="Number of matches required before stopping. [DEFAULT:5000]")
+    parser.add_argument("-e", "--error-rate", type=float, default=1e-6,
+                        help="Stop reading a VCF as soon as the version with most matches holds more than 50%% of them "
+                             "with at most this probability of error. The confidence is reported. 0 disables it. "
+                             "[DEFAULT:1e-6]")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Read bgzipped VCFs with a tabix/CSI index from the start instead of sampling windows "
+                             "through the index.")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Threads decompressing each bgzipped VCF or BCF. [DEFAULT: number of CPUs, up to 4]")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Number of files processed at the same time with --file-list. [DEFAULT: number of CPUs]")
+    parser.add_argument("-o", "--output-format", choices=["rich", "jsonl", "tsv"], default="rich",
+                        help="rich: formatted report for interactive use. jsonl / tsv: one machine-readable line per "
+                             "input file, with build, species, flavor, match counts and timings. [DEFAULT: rich]")
     parser.add_argument("-r", "--resources", action="store_true",
                         help="When set, print execution time, CPU, memory, and disk I/O usage.")
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if not 0 <= args.error_rate < 1:
+        parser.error("--error-rate must be between 0 and 1")
+    if args.threads is not None and args.threads < 1:
+        parser.error("--threads must be at least 1")
 
     # Conditional resource monitoring
     if args.resources:
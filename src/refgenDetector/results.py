@@ -0,0 +1,160 @@
+import json
+from dataclasses import dataclass, field, fields, asdict
+
+
+@dataclass
+class InferenceResult:
+    """
+    Everything inferred from one input file. Filled by the alignment and variant modules, printed with Rich by
+    print_result() in the interactive mode or written as one JSON Lines / TSV record by write_record().
+    """
+    file: str
+    file_type: str
+    status: str = "not_inferred"  # inference from the header: inferred, not_inferred, inconsistent or error
+    species: str | None = None
+    build: str | None = None  # major release
+    version: str | None = None  # reference genome version, the flavor if one is inferred
+    flavor: str | None = None
+    header_matches: int = 0  # contig lengths of the file matching the major release
+    inconsistent_contigs: list = field(default_factory=list)
+    inconsistent_builds: list = field(default_factory=list)
+    assembly: str | None = None
+    md5: dict = field(default_factory=dict)
+    n_samples: int | None = None
+    gvcf_header: bool = False
+    gvcf_alt: bool = False
+    variant_status: str | None = None  # inference from the REF column: inferred, not_inferred or error
+    variant_build: str | None = None
+    variant_matches: dict = field(default_factory=dict)
+    variant_confidence: float | None = None  # posterior probability that variant_build holds >50% of the matches
+    variants_read: int = 0
+    message: str | None = None
+    variant_message: str | None = None
+    elapsed_seconds: float = 0.0
+
+
+RESULT_FIELDS = [result_field.name for result_field in fields(InferenceResult)]
+
+
+def to_record(result, md5=True, assembly=True):
+    """
+    Converts a result into a flat dictionary ready to be serialized.
+    Args:
+        result (InferenceResult): result of one file
+        md5 (bool): keep the M5 values of the header, emptied otherwise
+        assembly (bool): keep the AS value of the header, emptied otherwise
+    """
+    record = asdict(result)
+    if not md5:
+        record["md5"] = {}
+    if not assembly:
+        record["assembly"] = None
+    record["elapsed_seconds"] = round(result.elapsed_seconds, 6)
+    return record
+
+
+def tsv_header():
+    """
+    Returns the header line of the TSV output.
+    """
+    return "\t".join(RESULT_FIELDS) + "\n"
+
+
+def tsv_value(value):
+    """
+    Formats one value of a TSV record: empty for None, compact JSON for lists and dictionaries.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":")) if value else ""
+    return str(value).replace("\t", " ").replace("\n", " ")
+
+
+def write_record(result, output_format, stream, md5=False, assembly=False):
+    """
+    Writes one result as a single line of JSON Lines or TSV, without going through Rich. As in print_result(), the
+    M5 and AS values are only written when asked for, the columns are left empty otherwise.
+    Args:
+        result (InferenceResult): result of one file
+        output_format (str): "jsonl" or "tsv"
+        stream: text stream where the line is written
+        md5 (bool): write the M5 values of the header (--md5)
+        assembly (bool): write the AS value of the header (-a)
+    """
+    record = to_record(result, md5, assembly)
+    if output_format == "jsonl":
+        stream.write(json.dumps(record, separators=(",", ":")) + "\n")
+    else:
+        stream.write("\t".join(tsv_value(record[name]) for name in RESULT_FIELDS) + "\n")
+    stream.flush()
+
+
+def print_header_inference(result, console):
+    """
+    Prints the reference genome inferred from the contigs of the header.
+    """
+    if result.status == "inferred":
+        console.print(f"[bold]Species detected:[/bold] {result.species} "
+                      f"\n[bold]Reference genome version:[/bold] {result.version}")
+        if result.message:
+            console.print(f"Note: {result.message}")
+    elif result.status == "inconsistent":
+        console.print(f"[bold]File:[/bold] {result.file} \n[bold][red]Error:[/bold] Inconsistency found "
+                      f"- file contains contigs from different genome versions[/red]")
+        console.print(f"[red]Contigs {result.inconsistent_contigs} belong to {', '.join(result.inconsistent_builds)},"
+                      f" but the rest belongs to {result.build}[/red].")
+    elif result.status == "error":
+        console.print(f"[bold]File:[/bold] {result.file} \n[bold][red]Error:[/bold][red] {result.message}")
+    elif result.file_type == "VCF" and result.message:
+        console.print(f"[dark_orange]{result.message}[/dark_orange] - [bold dark_orange]The reference genome can't "
+                      f"be inferred from the header information [/bold dark_orange]")
+    elif result.message:
+        console.print(f"[bold][red]Reference genome can't be inferred[/bold] - {result.message}[red]")
+
+
+def print_variant_inference(result, console):
+    """
+    Prints the reference genome inferred from the REF column of a VCF (both alleles of a .bim/.pvar).
+    """
+    column = "ALLELES" if result.file_type == "BIM" else "REF COLUMN"
+    console.print(f"[bold]\n++ INFORMATION INFERRED BY THE {column} ++ [/bold]\n ")
+    if result.variant_matches:
+        console.print(f"[bold]Matches: [/bold]", result.variant_matches)
+    if result.variant_status == "inferred":
+        console.print(f"[bold]Inferred Reference genome:[/bold] {result.variant_build}")
+        console.print(f"[bold]Confidence:[/bold] {result.variant_confidence:.6f} "
+                      f"(error probability {1 - result.variant_confidence:.1e})")
+    elif result.variant_message:
+        console.print(result.variant_message, style="bold red")
+    if result.gvcf_alt:
+        console.print(f"[bold]gVCF by ALT column[/bold]")
+
+
+def print_result(result, console, md5=False, assembly=False):
+    """
+    Interactive output: prints the result of one file with Rich markup.
+    Args:
+        result (InferenceResult): result of one file
+        console (rich.console.Console): console used to print
+        md5 (bool): print the M5 values of the header (--md5)
+        assembly (bool): print the AS value of the header (-a)
+    """
+    console.print(f"[bold]++ INFORMATION INFERRED BY THE HEADER ++[/bold]\n")
+    console.print(f"[bold]File:[/bold] {result.file}")
+    console.print(f"[bold]File type:[/bold] {result.file_type}")
+    print_header_inference(result, console)
+    if assembly and result.assembly:
+        console.print(f"[bold]AS field:[/bold] {result.assembly}")
+    if md5 and result.md5:
+        console.print(f"[bold]MD5 fields:[/bold] {result.md5}")
+    if result.file_type == "BIM" and result.variant_status is not None:
+        print_variant_inference(result, console)
+    if result.file_type == "VCF":
+        if result.gvcf_header:
+            console.print(f"[bold]gVCF according to header[/bold]")
+        if result.n_samples is not None:
+            console.print(f"[bold]Number of samples:[/bold]", result.n_samples)
+        if result.variant_status is not None:
+            print_variant_inference(result, console)
+    console.print(f"---")
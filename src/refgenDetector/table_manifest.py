@@ -0,0 +1,187 @@
+"""
+Manifest of the reference tables converted from the msgpacks (see variant_tables.py).
+
+tables/manifest.json records the format version of the tables and, for every table (one per chromosome), its number
+of rows, the genome versions of its columns, the msgpacks it was merged from (size, modification time and sha256)
+and the size and sha256 of each of its files:
+
+    {"format_version": 5,
+     "tables": {"chrY": {"rows": 3610258,
+                         "versions": ["hg18", "GRCh37", "GRCh38", "T2T"],
+                         "sources": [{"file": "hg18-chrY.msgpack", "size": 25271811, "mtime_ns": ...,
+                                      "sha256": "..."}, ...],
+                         "files": {"chrY.prefilter.npy": {"size": 7118870, "sha256": "..."}, ...}}}}
+
+A msgpack is unchanged if it has the same size and modification time. If only its modification time changed (e.g.
+copied or extracted again) its sha256 decides, so a msgpack regenerated with the same size is never taken for the one
+converted.
+
+The tables of an installation are checked against it by `refgenDetector-manager check-tables [--full]` (ref_manager.py,
+see validate_tables()): sizes and modification times by default, every sha256 with --full. Loading a table for a scan
+only checks the msgpacks it was merged from (see is_current()).
+"""
+
+import os
+import json
+import hashlib
+
+TABLES_FORMAT_VERSION = 5
+MANIFEST_NAME = "manifest.json"
+
+# Works both when installed as a pip package and when run directly as a script
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+MSGPACK_DIR = os.path.join(PACKAGE_DIR, "msgpacks")
+TABLES_DIR = os.path.join(PACKAGE_DIR, "tables")
+
+
+def manifest_path(tables_dir=TABLES_DIR):
+    return os.path.join(tables_dir, MANIFEST_NAME)
+
+
+def read_manifest(tables_dir=TABLES_DIR):
+    """
+    Reads the manifest of a tables directory.
+    Returns:
+        manifest (dict), or None if it doesn't exist, can't be read or was written for another format version
+    """
+    try:
+        with open(manifest_path(tables_dir)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("format_version") != TABLES_FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def write_manifest(manifest, tables_dir=TABLES_DIR):
+    """
+    Writes the manifest next to its final path and renames it, so it's never read half written.
+    """
+    path = manifest_path(tables_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def new_manifest():
+    return {"format_version": TABLES_FORMAT_VERSION, "tables": {}}
+
+
+def file_sha256(path):
+    """
+    sha256 of a file, read in blocks of 1 MB.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_entry(path):
+    """
+    Describes a msgpack a table is merged from: its name, size, modification time (ns) and sha256.
+    """
+    stat = os.stat(path)
+    return {"file": os.path.basename(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_sha256(path)}
+
+
+def table_entry(rows, versions, source_paths, paths):
+    """
+    Describes a converted table for the manifest.
+    Args:
+        rows (int): number of positions of the table
+        versions (list[str]): genome versions of the columns of the table
+        source_paths (list[str]): msgpacks the table was merged from
+        paths (list[str]): files of the table
+
+    Returns:
+        entry (dict) with the rows, the versions, the sources (see source_entry()) and the size and sha256 of each
+        file
+    """
+    return {"rows": int(rows),
+            "versions": list(versions),
+            "sources": [source_entry(path) for path in source_paths],
+            "files": {os.path.basename(path): {"size": os.path.getsize(path), "sha256": file_sha256(path)}
+                      for path in paths}}
+
+
+def record_table(name, entry, tables_dir=TABLES_DIR):
+    """
+    Adds one table to the manifest, e.g. after converting it the first time it was needed. Another process doing the
+    same at the same time can drop the entry, in which case the table is converted again the next time.
+    """
+    manifest = read_manifest(tables_dir) or new_manifest()
+    manifest["tables"][name] = entry
+    write_manifest(manifest, tables_dir)
+
+
+def is_current(entry, msgpack_dir=MSGPACK_DIR, full=False):
+    """
+    True if the msgpacks a table was merged from are unchanged, or were removed after the conversion. A msgpack with
+    the size and modification time recorded is unchanged; the sha256 is only compared when its modification time
+    changed, or for every msgpack if full is True.
+    """
+    for source in entry["sources"]:
+        try:
+            stat = os.stat(os.path.join(msgpack_dir, source["file"]))
+        except OSError:
+            continue
+        if stat.st_size != source["size"]:
+            return False
+        if (full or stat.st_mtime_ns != source["mtime_ns"]) and (
+                file_sha256(os.path.join(msgpack_dir, source["file"])) != source["sha256"]):
+            return False
+    return True
+
+
+def validate_tables(msgpack_dir=MSGPACK_DIR, tables_dir=TABLES_DIR, full=False):
+    """
+    Checks that the tables are complete and match this version of refgenDetector: every msgpack is converted, with
+    the current format, its msgpacks are unchanged and every file of the manifest exists with its size. Only file
+    sizes and modification times are compared unless full is True, so the check takes milliseconds.
+    Args:
+        msgpack_dir (str): directory with the msgpacks
+        tables_dir (str): directory with the converted tables
+        full (bool): also compare the sha256 of every file and of every msgpack
+
+    Returns:
+        problems (list[str]), empty if the installation is valid
+    """
+    try:
+        with open(manifest_path(tables_dir)) as f:
+            manifest = json.load(f)
+    except OSError:
+        return [f"No manifest found in {tables_dir}, run refgenDetector-manager build-tables"]
+    except ValueError:
+        return [f"The manifest in {tables_dir} is corrupted, run refgenDetector-manager build-tables"]
+    if manifest.get("format_version") != TABLES_FORMAT_VERSION:
+        return [f"The tables in {tables_dir} have format version {manifest.get('format_version')}, this version of "
+                f"refgenDetector uses {TABLES_FORMAT_VERSION}. Run refgenDetector-manager build-tables"]
+
+    tables = manifest.get("tables", {})
+    if not tables:
+        return [f"The manifest in {tables_dir} lists no tables, run refgenDetector-manager build-tables"]
+
+    problems = []
+    if os.path.isdir(msgpack_dir):
+        sources = {source["file"] for entry in tables.values() for source in entry["sources"]}
+        for msgpack_file in sorted(os.listdir(msgpack_dir)):
+            if msgpack_file.endswith(".msgpack") and msgpack_file not in sources:
+                problems.append(f"{msgpack_file} is not converted")
+
+    for name, entry in sorted(tables.items()):
+        if not is_current(entry, msgpack_dir, full):
+            problems.append(f"{name}: its msgpacks changed after the conversion")
+        for file_name, described in sorted(entry["files"].items()):
+            path = os.path.join(tables_dir, file_name)
+            if not os.path.exists(path):
+                problems.append(f"{name}: {file_name} is missing")
+            elif os.path.getsize(path) != described["size"]:
+                problems.append(f"{name}: {file_name} has {os.path.getsize(path)} bytes, {described['size']} expected")
+            elif full and file_sha256(path) != described["sha256"]:
+                problems.append(f"{name}: {file_name} doesn't match its sha256")
+    return problems
@@ -1,267 +1,635 @@
-import gzip
-import sys
-import time
-import pandas as pd
-from dns.inet import inet_pton
-from rich.console import Console
 import os
+import math
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from queue import Queue, Full
 import numpy as np 
-import msgpack
 try:
     # Works when installed as a pip package
     from .aligment_files import *
     from .chromosomes_dict import *
+    from .results import InferenceResult
+    from .variant_tables import load_table, table_nbytes, match_rows, sampling_windows
+    from .bgzf import open_compressed, default_threads
+    from .inputs import is_stream, open_input, content_prefix, pipe_to_fd, BCF_MAGIC
+    from .vcf_tokenizer import tokenize, read_records, slice_records, site_records, read_sites
 except ImportError:
     # Works when run directly as a script
     from aligment_files import comparison
     from chromosomes_dict import *
+    from results import InferenceResult
+    from variant_tables import load_table, table_nbytes, match_rows, sampling_windows
+    from bgzf import open_compressed, default_threads
+    from inputs import is_stream, open_input, content_prefix, pipe_to_fd, BCF_MAGIC
+    from vcf_tokenizer import tokenize, read_records, slice_records, site_records, read_sites
 
-# Works both when installed as a pip package and when run directly as a script
-MSGPACK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "msgpacks")
 
+_console = None
 
 
-final_results = []
-console = Console(highlight=False)
-_msgpack_cache = {}
-_current_chr = None
+def get_console():
+    """Rich console of the progress of verbose scans, created on first use so jsonl/tsv runs never import Rich."""
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console(highlight=False)
+    return _console
 
-def gather_and_sum(lists):
-    """
-    It gathers and sums all the matches calculated in get_matches()
-    Args:
-        lists: list of lists with the matches calculated in get_matches() for each chunk.
-    Returns:
-        A dictionary with the total number of matches for each version, which is used to infer the reference genome version.
-    """
-    cumulative_sums = {}
-    for lst in lists:
-        for key, value in lst:
-            if key in cumulative_sums:
-                cumulative_sums[key] += value
-            else:
-                cumulative_sums[key] = value
-    console.print(f"[bold]Matches: [/bold]", cumulative_sums)
-    return cumulative_sums
 
-def get_matches(snps_dict, chr_):
-    """
-    For each chromosome, it looks for the matches of the SNPs in the corresponding msgpack files, 
-    which contain the reference genome information for each version. It returns a list with the number of matches for each version.
-    Args:        
-        snps_dict: dictionary with the position and the nucleotide of the SNPs in the chunk being processed. 
-        chr_: chromosome of the chunk being processed, used to load the corresponding msgpack and get the matches.
-    Returns:
-        A list with the number of matches for each version, which is used to infer the reference genome version.
-    """
-    
-    global _msgpack_cache, _current_chr
-    start = time.time()
+# Sampling of indexed VCFs (see sample_indexed())
+WINDOW_BP = 20000
+WINDOWS_PER_ROUND = 8
+MAX_WINDOWS = 1024
 
-    genome_versions = ["hg18", "GRCh37", "GRCh38", "T2T"]
-    matches = []
+# Early stop once the inferred version is separated from the others (see leader_confidence())
+ERROR_RATE = 1e-6
+MIN_MATCHES = 100
 
-    # If we've moved on to a different chromosome, drop the previous
-    # chromosome's msgpacks before loading the new ones.
-    if chr_ != _current_chr:
-        _msgpack_cache.clear()
-        _current_chr = chr_
+# Records between two checks of the stopping conditions (see VariantInference.add_chunk())
+STOP_CHECK_ROWS = 1024
 
-    positions = np.array(list(snps_dict.keys()), dtype=np.int64)
-    nucleotides = np.array(list(snps_dict.values()))
+# Chunks tokenized ahead of the matching by the reader thread (see prefetch())
+PREFETCH_CHUNKS = 2
 
-    for version_name in genome_versions:
-        cache_key = f"{version_name}-{chr_}"
+# Memory ceiling of the reference tables kept loaded by one scan, in MB (see VariantInference.table())
+TABLE_CACHE_MB = 1024
 
-        if cache_key not in _msgpack_cache:
-            path = os.path.join(MSGPACK_DIR, f"{cache_key}.msgpack")
-            if not os.path.exists(path):
-                continue
-            with open(path, "rb") as f:
-                _msgpack_cache[cache_key] = msgpack.load(f, raw=False, strict_map_key=False)
+# Memory budget of the chunks read from a VCF, in MB (see vcf_tokenizer.read_records())
+CHUNK_MEMORY_MB = 256
 
-        ref_dict = _msgpack_cache[cache_key]
 
-        ref_nucs = np.array([ref_dict.get(p, None) for p in positions])
-        match_count = int(np.sum(ref_nucs == nucleotides))
+def table_cache_bytes():
+    """
+    Memory ceiling of the table cache of a scan: $REFGENDETECTOR_TABLE_CACHE_MB if set (e.g. in small containers),
+    otherwise TABLE_CACHE_MB.
+    """
+    return int(os.environ.get("REFGENDETECTOR_TABLE_CACHE_MB", TABLE_CACHE_MB)) << 20
 
-        matches.append([version_name, match_count])
 
-    return matches
+def chunk_memory_bytes():
+    """
+    Memory budget of the reading of a VCF: $REFGENDETECTOR_CHUNK_MEMORY_MB if set, otherwise CHUNK_MEMORY_MB.
+    """
+    return int(os.environ.get("REFGENDETECTOR_CHUNK_MEMORY_MB", CHUNK_MEMORY_MB)) << 20
 
 
+class VariantInference:
+    """
+    Session of the inference of one VCF from its REF column. It owns all the state of the scan: the running total of
+    matches of each version, the reference tables loaded (see table()), the chromosome names coded by the tokenizer,
+    the gVCF status and the stopping conditions. Nothing is kept at module level, so several VCFs can be scanned at
+    the same time in one process (e.g. a long-lived worker), each one with its own session:
+
+        session = VariantInference(result, n_matches=5000)
+        for records in read_records(stream, session.chrom_names, chunk_memory_bytes()):
+            if session.add_chunk(records):
+                break
+        session.finish()
+    """
 
-def trimming_indels(content, ref):
+    def __init__(self, result, n_matches=None, max_n_var=None, error_rate=ERROR_RATE, cache_bytes=None,
+                 both_alleles=False, chromosomes=None):
+        """
+        Args:
+            result (InferenceResult): result of the file, filled with the inference from the REF column
+            n_matches (int | None): stop once this number of matches is exceeded
+            max_n_var (int | None): stop once this number of variants is read
+            error_rate (float | None): stop once the inferred version is wrong with at most this probability
+            cache_bytes (int | None): memory ceiling of the loaded tables, table_cache_bytes() if None
+            both_alleles (bool): match both alleles of each SNP, for files where REF isn't known (PLINK A1/A2)
+            chromosomes (dict | None): chromosome names of the file to the names of the tables, chromosome_map if None
+        """
+        self.result = result
+        self.both_alleles = both_alleles
+        self.chromosomes = chromosome_map if chromosomes is None else chromosomes
+        self.n_matches = n_matches
+        self.max_n_var = max_n_var
+        self.error_rate = error_rate
+        self.matches = {}
+        self.chunk_matches = []  # matches of the chunk being matched, by record (see add_matches())
+        self.gvcf = False
+        self.chrom_names = []
+        self.table_cache = OrderedDict()  # from the least to the most recently used
+        self.cached_bytes = 0
+        self.cache_bytes = table_cache_bytes() if cache_bytes is None else cache_bytes
+
+    def table(self, chr_):
+        """
+        Returns the reference table of a chromosome (None if there is none), loaded once per session. When the
+        tables loaded exceed the memory ceiling, the least recently used ones are dropped, so an unsorted VCF loads
+        each table once unless they don't fit all at the same time.
+        Args:
+            chr_: chromosome of the table, e.g. "chr21"
+        Returns:
+            table (dict) as returned by variant_tables.load_table(), or None
+        """
+        if chr_ in self.table_cache:
+            self.table_cache.move_to_end(chr_)
+            return self.table_cache[chr_]
+
+        table = load_table(chr_)
+        size = table_nbytes(table)
+        # The new table is always kept, even if it's bigger than the ceiling alone
+        while self.table_cache and self.cached_bytes + size > self.cache_bytes:
+            _, evicted = self.table_cache.popitem(last=False)
+            self.cached_bytes -= table_nbytes(evicted)
+        self.table_cache[chr_] = table
+        self.cached_bytes += size
+        return table
+
+    def add_matches(self, rows, versions, matched):
+        """
+        Keeps the matches of the SNPs of one chromosome of the chunk being matched, as returned by get_matches(),
+        until add_chunk() adds them to the running totals.
+        Args:
+            rows (np.ndarray): row of each SNP in the chunk
+            versions (list[str]): versions of the columns of matched
+            matched (np.ndarray, bool): one row per SNP and one column per version
+        """
+        self.chunk_matches.append((rows, versions, matched))
+
+    def add_chunk(self, records, verbose=False):
+        """
+        Matches the SNPs of a chunk tokenized with the chromosome names of the session, all at once, then adds their
+        matches to the running totals in blocks of STOP_CHECK_ROWS records and checks the stopping conditions after
+        each one. -m, -v and the error rate thus stop the scan within a block of being met, whatever the size of the
+        chunks, and the records after that block don't count.
+        Args:
+            records (dict): chunk of the file, see vcf_tokenizer.tokenize()
+            verbose (bool): print the running totals (interactive mode)
+        Returns:
+            True once a stopping condition is met (see is_done())
+        """
+        n_rows = len(records["pos"])
+        n_blocks = -(-n_rows // STOP_CHECK_ROWS)
+        self.chunk_matches = []
+        self.gvcf = read_and_load(records, self, verbose) or self.gvcf
+        block_matches = {}
+        for rows, versions, matched in self.chunk_matches:
+            blocks = rows // STOP_CHECK_ROWS
+            for column, version_name in enumerate(versions):
+                counts = np.bincount(blocks[matched[:, column]], minlength=n_blocks)
+                block_matches[version_name] = block_matches.get(version_name, 0) + counts
+        self.chunk_matches = []
+
+        done = self.is_done()
+        for block in range(n_blocks):
+            for version_name, counts in block_matches.items():
+                self.matches[version_name] = self.matches.get(version_name, 0) + int(counts[block])
+            self.result.variants_read += min(STOP_CHECK_ROWS, n_rows - block * STOP_CHECK_ROWS)
+            done = self.is_done()
+            if done:
+                break
+        if verbose:
+            get_console().print(f"[bold]Matches: [/bold]", self.matches)
+        return done
+
+    def is_done(self):
+        """
+        True once a stopping condition is met: more than n_matches matches, max_n_var variants read or the
+        version with most matches separated from the others at error_rate (see is_decisive()).
+        """
+        if self.n_matches is not None and self.n_matches < sum(self.matches.values()):
+            return True
+        if self.max_n_var is not None and self.result.variants_read >= self.max_n_var:
+            return True
+        return is_decisive(self.matches, self.error_rate, self.both_alleles)
+
+    def finish(self):
+        """
+        Infers the reference genome from the matches collected, see finish_variant_inference().
+        """
+        return finish_variant_inference(self.result, dict(self.matches), self.gvcf, self.both_alleles)
+
+
+def get_matches(positions, nucleotides, chr_, session):
     """
-    If a row is longer than one position it is deleted, deleting this way any indels
-    Args:
-        content: chunk of the file being read, containing the variants information. It must only contain SNPs, as indels are trimmed in this function.
-        ref: column number of the reference allele in the file, which is different in vcfs and bim files. 
+    For each chromosome, it looks for the matches of the SNPs in the reference table of the chromosome (see
+    variant_tables.py), which holds the base of every genome version at each distinguishing position. One lookup of
+    the whole chunk returns the matches of all the versions. It returns the versions of the table and, for each SNP,
+    the versions it matches.
+    Args:        
+        positions: positions of the SNPs in the chunk being processed (np.ndarray, int64), without duplicates.
+        nucleotides: REF bases of the SNPs, in the same order as the positions (np.ndarray, ASCII codes as given by encode_bases()).
+        chr_: chromosome of the chunk being processed, used to load the corresponding table and get the matches.
+        session (VariantInference): session of the file, holding the tables already loaded
     Returns:
-        A dataframe with only the SNPs in the chunk, and the gVCF status of the chunk.
+        The versions of the table (list) and a boolean matrix with one row per SNP and one column per version, which
+        are used to infer the reference genome version. No versions if the chromosome has no table.
     """
-    try:
-         # Keep only rows where REF is length 1 or <NON_REF>
-        del_insertions = content[(content.iloc[:, 2].str.len() == 1) | (content.iloc[:, 2] == '<NON_REF>')]
-        
-        # Keep only rows where ALT is length 1 or <NON_REF>
-        vcf_snps = del_insertions[
-            (del_insertions.iloc[:, 3].str.len() == 1) | (del_insertions.iloc[:, 3] == '<NON_REF>')]
-        
-        # Select columns and make an explicit copy
-        snps = vcf_snps.iloc[:, [1, ref]].copy()
-        snps.columns = ['position', 'nucleotide']
+    
+    table = session.table(chr_)
+    if table is None:
+        return [], np.zeros((len(positions), 0), dtype=bool)
 
-        # Safe assignment using .loc
-        snps.loc[:, 'nucleotide'] = snps['nucleotide'].str.upper()
+    return table["versions"], match_rows(table, positions, nucleotides)
 
-        gVCF = False
-        if content.iloc[:, 3].astype(str).str.contains('<NON_REF>').any():
-            gVCF = True
 
-        return snps, gVCF
-    
-    except Exception:
-        console.print("Reference column is empty, please check your input file. Stopping scan.")
-        sys.exit(1)
 
+def trimming_indels(records, rows):
+    """
+    Keeps the SNPs among some records: REF of one base and ALT of one base or <NON_REF>, deleting this way any indels
+    Args:
+        records: chunk of the file being read, tokenized by vcf_tokenizer.tokenize()
+        rows: boolean mask of the records to trim, e.g. the records of one chromosome
+    Returns:
+        The boolean mask of the SNPs among rows, and the gVCF status of the rows.
+    """
+    snps = rows & (records["ref_len"] == 1) & ((records["alt_len"] == 1) | records["alt_non_ref"])
+    gVCF = bool(records["has_non_ref"][rows].any())
+    return snps, gVCF
 
-def call_trimming(content, chr):
+
+def call_trimming(records, rows, chr, session, verbose=False):
     """ 
-    The file must only contain SNPs. This function is necessary because the reference column has a different number in vcfs and in bim files 
+    Trims the indels of the records of one chromosome and gets the matches of its SNPs.
     Args:   
-        content: chunk of the file being read, containing the variants information. It must only contain SNPs, as indels are trimmed in the function.
-        chr: chromosome of the chunk being processed, used to load the corresponding msgpack and get the matches.
+        records: chunk of the file being read, tokenized by vcf_tokenizer.tokenize()
+        rows: boolean mask of the records of the chromosome
+        chr: chromosome of the records, used to load the corresponding table and get the matches.
+        session (VariantInference): session of the file
+        verbose: print the progress of the scan (interactive mode)
     Returns:
-        Calls get_matches() with the SNPs in the chunk, and adds the matches to the global variable final_results. It also returns the gVCF status of the chunk, which is True if any of the variants in the chunk has <NON_REF> in the ALT column, and False otherwise.
+        Calls get_matches() with the SNPs in the chunk (both alleles if the session asks for it), and hands the matches of each SNP to the session (see VariantInference.add_matches()). It also returns the gVCF status of the chunk, which is True if any of the variants in the chunk has <NON_REF> in the ALT column, and False otherwise.
     """
 
-    snps, gVCF = trimming_indels(content, 2)  # content : chr pos ref alt
-
-    if len(snps) != 0:
-        snps_dict = dict(zip(snps["position"].astype(int), snps["nucleotide"]))
-        results = get_matches(snps_dict, chr)  # pass dict, not DataFrame
-        final_results.append(results)
-    else:
-        console.print("There aren't FP SNPs in this chunk", style="bold red")
+    snps, gVCF = trimming_indels(records, rows)
+
+    if snps.any():
+        positions = records["pos"][snps]
+        nucleotides = records["ref"][snps]
+        # One SNP per position, the last one as when they were collected in a dictionary
+        _, last = np.unique(positions[::-1], return_index=True)
+        keep = len(positions) - 1 - last
+        snp_rows = np.flatnonzero(snps)[keep]
+        session.add_matches(snp_rows, *get_matches(positions[keep], nucleotides[keep], chr, session))
+        if session.both_alleles:
+            # A1/A2 of PLINK files aren't REF/ALT: a version matches if its base is either allele. Its base is only
+            # one of them, so the matches of both add up, unless both alleles are the same base.
+            alleles = records["alt"][snps][keep]
+            alleles[alleles == nucleotides[keep]] = 255
+            session.add_matches(snp_rows, *get_matches(positions[keep], alleles, chr, session))
+    elif verbose:
+        get_console().print("There aren't FP SNPs in this chunk", style="bold red")
     
     return gVCF
 
 
-def read_and_load(chunk):
+def read_and_load(records, session, verbose=False):
     """
-    Check the chromosome in the chunk and load only the msgpacks corresponding to that chromosome, 
+    Check the chromosomes in the chunk and load only the reference table of each one, 
     then call the function to trim indels and get the matches.
     Args:
-        chunk: chunk of the file being read, containing the variants information. It must only contain SNPs, as indels are trimmed in the function.
+        records: chunk of the file being read, tokenized by vcf_tokenizer.tokenize() with the chromosome names of the session
+        session (VariantInference): session of the file
+        verbose: print the progress of the scan (interactive mode)
     Returns:
         The gVCF status of the chunk, which is True if any of the variants in the chunk has <NON_REF> in the ALT column, and False otherwise.
     """
-    for chromosome, group_content in chunk.groupby(chunk.columns[0]):
-        chromosome_str = str(chromosome)
-        if chromosome_str in chromosome_map:
-            chr_key = chromosome_map[chromosome_str]  
-            gVCF = call_trimming(group_content, chr_key)
-            console.print("Variants being mapped from:", chr_key)
+    gVCF = False
+    names = session.chrom_names
+    for code in sorted(np.unique(records["chrom"]).tolist(), key=lambda code: names[code]):
+        chromosome_str = names[code]
+        if chromosome_str in session.chromosomes:
+            chr_key = session.chromosomes[chromosome_str]  
+            gVCF = call_trimming(records, records["chrom"] == code, chr_key, session, verbose) or gVCF
+            if verbose:
+                get_console().print("Variants being mapped from:", chr_key)
             
-        else:
-            console.print(f"Chromosome {chromosome_str} not found in chromosome map. Skipping variants from {chromosome_str}.")
+        elif verbose:
+            get_console().print(f"Chromosome {chromosome_str} not found in chromosome map. Skipping variants from {chromosome_str}.")
 
     return gVCF
 
 
-def read_chunks(complete_file, cols, n_matches=None, max_n_var=None):
+def prefetch(chunks, depth=PREFETCH_CHUNKS):
+    """
+    Iterates over chunks from a reader thread, which reads and tokenizes up to depth chunks ahead of the consumer
+    through a bounded queue, so the decompression and parsing of the next chunks overlap the matching of the current
+    one. The reader waits while the queue is full. An exception of the reader is raised to the consumer, and closing
+    the generator (the consumer stopped early) stops the reader and waits for it, so the file can be closed.
+    Args:
+        chunks: iterator of chunks, e.g. vcf_tokenizer.read_records()
+        depth (int): chunks kept in the queue
+    Yields:
+        the chunks, in order
+    """
+    queue = Queue(maxsize=depth)
+    stop = threading.Event()
+    end = object()
+
+    def offer(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for chunk in chunks:
+                if not offer(chunk):
+                    return
+        except Exception as e:
+            offer(e)
+        else:
+            offer(end)
+
+    reader = threading.Thread(target=read, name="refgenDetector-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+
+
+def read_chunks(complete_file, result, n_matches=None, max_n_var=None, verbose=False, first_record=b"",
+                error_rate=ERROR_RATE):
     """
     Loads the file in batches to avoid loading it completely in memory.
-    By default, all variants are read.
+    By default, all variants are read. The number of variants of each chunk follows the bytes per line of the file
+    and the memory budget (see chunk_memory_bytes()), and the next chunks are read by another thread while the
+    current one is matched (see prefetch()).
 
     If `n_matches` is provided (e.g. via -m in argparse), the file will be
     read in chunks until the total number of SNP matches reaches or exceeds
     `n_matches`. At that point the loop stops and the inference is done
-    with the matches collected so far.
+    with the matches collected so far. The scan also stops as soon as the version with most matches is separated
+    from the others at `error_rate` (see is_decisive()).
 
     Args:
-        complete_file (str): path to the file to read
-        cols (list[int]): column indices to load
+        complete_file: opened binary stream, after the header
+        result (InferenceResult): result of the file, filled with the inference from the REF column
         n_matches (int | None): total number of matches required before
                                   stopping early. If None, read all chunks.
+        max_n_var (int | None): number of variants read at most. If None, read all chunks.
+        verbose (bool): print the progress of the scan (interactive mode)
+        first_record (bytes): first line after the header, already read by extract_header()
+        error_rate (float | None): stop once the inferred version is wrong with at most this probability. If None,
+                                   only n_matches and max_n_var stop the scan.
     Returns:
-        Chunks of 100.000 variants for the inference, until the stopping condition is met (if any).
+        result (InferenceResult) with the inference from the chunks read until the stopping condition is met (if any).
+    """
+    session = VariantInference(result, n_matches, max_n_var, error_rate)
+    chunks = read_records(complete_file, session.chrom_names, chunk_memory_bytes(), first_record, max_n_var)
+    return scan_records(chunks, session, verbose)
+
+
+def read_variants(variants, result, n_matches=None, max_n_var=None, verbose=False, error_rate=ERROR_RATE):
+    """
+    Same as read_chunks() for the records of a BCF read by htslib: only CHROM, POS, REF and ALT of each record are
+    taken, the genotypes are dropped when the file is opened and never decoded.
+    Args:
+        variants (pysam.VariantFile): file opened with drop_samples=True, after the header
+        result (InferenceResult): result of the file, filled with the inference from the REF column
+        n_matches (int | None): total number of matches required before stopping early. If None, read all chunks.
+        max_n_var (int | None): number of variants read at most. If None, read all chunks.
+        verbose (bool): print the progress of the scan (interactive mode)
+        error_rate (float | None): stop once the inferred version is wrong with at most this probability
+    Returns:
+        result (InferenceResult) with the inference from the chunks read until the stopping condition is met (if any).
+    """
+    session = VariantInference(result, n_matches, max_n_var, error_rate)
+    chunks = read_sites(variants, session.chrom_names, chunk_memory_bytes(), max_n_var)
+    return scan_records(chunks, session, verbose)
+
+
+def scan_records(chunks, session, verbose=False):
+    """
+    Matches the chunks of a file, read by another thread (see prefetch()), until a stopping condition of the session
+    is met. A ValueError (e.g. POS isn't a number) is reported in the result.
+    Args:
+        chunks: iterator of the chunks of the file, e.g. vcf_tokenizer.read_records()
+        session (VariantInference): session of the file
+        verbose (bool): print the progress of the scan (interactive mode)
+    Returns:
+        result (InferenceResult) of the session with the inference from the chunks read
     """
-    chunk_counter = 0
-    results = {}
-    gVCF = False  # track if any chunk looks like gVCF
-    console.print("[bold]\n++ INFORMATION INFERRED BY THE REF COLUMN ++ [/bold]\n ")
     try:
 
-        for chunk in pd.read_csv(complete_file, sep="\t", comment="#", header=None, chunksize=100000, usecols=cols,):
-            chunk_counter = chunk_counter+100000
-            # Update global gVCF flag if any chunk reports True
-            chunk_gvcf = read_and_load(chunk)
-            gVCF = gVCF or chunk_gvcf
-
-            # Update global results 
-            results = gather_and_sum(final_results)
-
-            # If user requested an early stop based on number of variants read
-            if max_n_var is not None: 
-                try:
-                    if chunk_counter > max_n_var:
-                        break
-                except ValueError:
-                        console.print("0 FP SPNs in this chunk", style="bold")
-
-            # If user requested an early stop based on number of matches
-
-            if n_matches is not None:
-                results_matches = sum(results.values()) if results else 0
-                if n_matches < results_matches:
-                    # Enough evidence; stop reading more chunks
+        with closing(prefetch(chunks)) as chunks:
+            for chunk in chunks:
+                # Enough evidence (or variants read); stop reading more chunks
+                if session.add_chunk(chunk, verbose):
                     break
             
+    except ValueError as e:
+        session.result.variant_status = "error"
+        session.result.variant_message = str(e)
 
-    finally:
-        # Inference and messages
+    return session.finish()
+
+
+def binomial_upper_tail(n, k):
+    """
+    P(X >= k) for X ~ Binomial(n, 1/2), summed from its largest term so it doesn't underflow when it's tiny.
+    """
+    if k <= 0:
+        return 1.0
+    if k > n:
+        return 0.0
+    if 2 * k <= n:
+        return 1.0 - binomial_upper_tail(n, n - k + 1)
+    log_term = math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1) - n * math.log(2)
+    term = math.exp(log_term)
+    tail = 0.0
+    for j in range(k, n + 1):
+        tail += term
+        if term < tail * 1e-17:
+            break
+        term *= (n - j) / (j + 1)
+    return tail
+
+
+def contested_matches(results, both_alleles=False):
+    """
+    Matches the version with most matches is compared to: those of all the versions, or with both_alleles only those
+    of the leader and the runner-up. When both alleles of every SNP are matched (PLINK A1/A2), every version that isn't
+    the one of the file still matches by chance wherever its base is the other allele, so the matches of all the
+    versions would dilute the leader under 50% even when its count is exact.
+    Returns:
+        best (int) and contested (int) matches
+    """
+    counts = sorted(results.values(), reverse=True)
+    if both_alleles:
+        return counts[0], sum(counts[:2])
+    return counts[0], sum(counts)
+
+
+def leader_confidence(results, both_alleles=False):
+    """
+    Confidence in the version with most matches: the posterior probability that it holds more than half of the
+    contested matches (see contested_matches()), i.e. that the >50% rule of finish_variant_inference() doesn't hold by
+    chance. With a uniform prior, the share of the leader follows Beta(best + 1, others + 1), and
+    P(share > 1/2) = P(Binomial(contested + 1, 1/2) <= best).
+    Args:
+        results (dict): total number of matches of each version
+        both_alleles (bool): the matches are of both alleles of every SNP, the leader is compared to the runner-up
+    Returns:
+        confidence (float), or None if there are no matches
+    """
+    if not results or sum(results.values()) == 0:
+        return None
+    best, contested = contested_matches(results, both_alleles)
+    return 1.0 - binomial_upper_tail(contested + 1, best + 1)
+
+
+def is_decisive(results, error_rate, both_alleles=False):
+    """
+    True if the version with most matches is separated from the others at the given error rate, after at least
+    MIN_MATCHES matches. Checked after every STOP_CHECK_ROWS records to stop the scan as soon as the evidence is
+    enough.
+    """
+    if error_rate is None or sum(results.values()) < MIN_MATCHES:
+        return False
+    return 1.0 - leader_confidence(results, both_alleles) <= error_rate
+
+
+def finish_variant_inference(result, results, gVCF, both_alleles=False):
+    """
+    Infers the reference genome from the matches of the REF column: the version with more than 50% of the matches,
+    reported with its confidence (see leader_confidence()). With both alleles matched (PLINK files), the version
+    with more than 50% of the matches of the leader and the runner-up, i.e. more matches than any other version.
+    Args:
+        result (InferenceResult): result of the file
+        results (dict): total number of matches of each version
+        gVCF (bool): any variant has <NON_REF> in the ALT column
+        both_alleles (bool): the matches are of both alleles of every SNP (see contested_matches())
+    Returns:
+        result (InferenceResult) with the inference from the REF column
+    """
+    result.variant_matches = results
+    result.variant_confidence = leader_confidence(results, both_alleles)
+    result.gvcf_alt = gVCF
+    if result.variant_status == "error":
+        return result
+    if not results or max(results.values()) == 0:
+        result.variant_status = "not_inferred"
+        result.variant_message = "No SNPs found to infer the reference genome."
+    else:
+        best_ref = max(results, key=results.get)
+        best_matches, contested = contested_matches(results, both_alleles)
+
+        if best_matches > contested / 2:
+            result.variant_status = "inferred"
+            result.variant_build = best_ref
+        elif both_alleles:
+            result.variant_status = "not_inferred"
+            result.variant_message = ("Two versions have the same number of matches. "
+                                      "Reference genome version unknown.")
+        else:
+            result.variant_status = "not_inferred"
+            result.variant_message = ("None of the versions has more than 50% of the total matches. "
+                                      "Reference genome version unknown.")
+    return result
+
+
+def find_index(input_file):
+    """
+    Returns the path of the tabix (.tbi) or CSI (.csi) index of a bgzipped VCF or BCF, or None if it isn't indexed.
+    """
+    for suffix in (".tbi", ".csi"):
+        if os.path.exists(input_file + suffix):
+            return input_file + suffix
+    return None
+
+
+def sample_indexed(input_file, index_path, result, n_matches=None, max_n_var=None, verbose=False,
+                   error_rate=ERROR_RATE):
+    """
+    Reads an indexed VCF through its index instead of from the start. Windows of WINDOW_BP bases are fetched where
+    the reference tables are dense (see variant_tables.sampling_windows()), spread along every chromosome of the file
+    with a table. Each round takes the next WINDOWS_PER_ROUND windows of every chromosome, so the evidence comes from
+    all of them from the first round, until the stopping condition is met or MAX_WINDOWS windows per chromosome are
+    read. The time does not depend on the size of the file. A BCF is fetched through htslib without its samples.
+    Args:
+        input_file (str): path to the bgzipped VCF or BCF
+        index_path (str): path to its .tbi or .csi index
+        result (InferenceResult): result of the file, filled with the inference from the REF column
+        n_matches (int | None): stop once this number of matches is exceeded. If None, read all the windows.
+        max_n_var (int | None): number of variants read at most. If None, read all the windows.
+        verbose (bool): print the progress of the scan (interactive mode)
+        error_rate (float | None): stop once the inferred version is wrong with at most this probability
+    Returns:
+        result (InferenceResult) with the inference from the REF column
+    """
+    import pysam
+
+    session = VariantInference(result, n_matches, max_n_var, error_rate)
+    bcf = input_file.endswith(".bcf")
+    if bcf:
+        save = pysam.set_verbosity(0)
         try:
-            if not results or max(results.values()) == 0:
-                console.print("No SNPs found to infer the reference genome.", style="bold red")
-            else:
-                best_ref = max(results, key=results.get)
-                best_matches = results[best_ref]
-                total_matches = sum(results.values())
-
-                if best_matches > total_matches / 2:
-                    console.print(
-                        f"[bold]Inferred Reference genome:[/bold] {best_ref}"
-                    )
-                else:
-                    console.print(
-                        "None of the versions has more than 50% of the total matches. "
-                        "[bold]Reference genome version unknown.[/bold]",
-                        style="red",
-                    )
+            indexed = pysam.VariantFile(input_file, index_filename=index_path, drop_samples=True)
+        except (OSError, ValueError) as e:
+            return bcf_error(result, e)
+        finally:
+            pysam.set_verbosity(save)
+    else:
+        indexed = pysam.TabixFile(input_file, index=index_path)
+    with indexed:
+        plan = []
+        for contig in (list(indexed.index) if bcf else indexed.contigs):
+            chr_key = chromosome_map.get(str(contig))
+            table = session.table(chr_key) if chr_key is not None else None
+            if table is not None:
+                plan.append((contig, sampling_windows(table, MAX_WINDOWS, WINDOW_BP)))
+            elif verbose:
+                get_console().print(f"Chromosome {contig} not found in the reference tables. Skipping variants from {contig}.")
 
-        except ValueError:
-            # Covers cases like max([]) or similar
-            console.print("No SNPs found to infer the reference genome.", style="bold red")
+        try:
+            for first in range(0, MAX_WINDOWS, WINDOWS_PER_ROUND):
+                lines = []
+                for contig, windows in plan:
+                    for start in windows[first:first + WINDOWS_PER_ROUND]:
+                        # 1-based window start, fetch() takes 0-based half-open coordinates
+                        lines.extend(indexed.fetch(contig, start - 1, start - 1 + WINDOW_BP))
+                if not lines:
+                    continue
+                if bcf:
+                    chunk = site_records([(record.chrom, record.pos, record.alleles) for record in lines],
+                                         session.chrom_names)
+                else:
+                    chunk = tokenize(("\n".join(lines) + "\n").encode("utf-8", "replace"), session.chrom_names,
+                                     chunk_memory_bytes() // 4)
+                if max_n_var is not None:
+                    chunk = slice_records(chunk, 0, max_n_var - result.variants_read)
+                if session.add_chunk(chunk, verbose):
+                    break
+        except ValueError as e:
+            result.variant_status = "error"
+            result.variant_message = str(e)
 
-    if gVCF:
-        console.print(f"[bold]gVCF by ALT column[/bold]")
+    return session.finish()
 
 
-def extract_columns(complete_file,  n_matches, max_n_var):
+def extract_columns(complete_file, result, n_matches, max_n_var, verbose=False, first_record=b"",
+                    error_rate=ERROR_RATE):
     """
     Extracts the columns of interest (chr, pos, ref, alt) and sends them to be processed. The inference is done with the matches collected until the stopping condition is met (if any).
     Args:        
-        complete_file: opened file with the header
+        complete_file: opened binary stream, after the header
+        result: result of the file, filled with the inference from the REF column
         n_matches: stop reading more chunks once the total number of matches reaches this value. By default, 5000 matches are required before stopping.
-        max_n_var: stop reading more chunks once the total number of variants read exceeds this value. If None, read all chunks.    
+        max_n_var: number of variants read at most. If None, read all chunks.
+        verbose: print the progress of the scan (interactive mode)
+        first_record: first line after the header, already read by extract_header()
+        error_rate: stop reading more chunks once the inferred version is wrong with at most this probability. If None, only n_matches and max_n_var stop the scan.
     Returns:
         Calls the function to read the file in chunks and process them, with the columns of interest.
     """
 
-    cols = [0, 1, 3, 4] # chr pos ref alt
-    read_chunks(complete_file, cols,  n_matches, max_n_var)
+    return read_chunks(complete_file, result, n_matches, max_n_var, verbose, first_record, error_rate)
 
 def get_n_samples(header):
     """
@@ -273,23 +641,22 @@ def get_n_samples(header):
     """
 
     mandatory_columns = ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"] #fixed fields for variant information
-    columns = header[-1].split("\t")
+    columns = header[-1].split("\t") if header else []
 
     try:
         for column in mandatory_columns:
             columns.remove(column)
-        n_samples = len(columns)
-        console.print(f"[bold]Number of samples:[/bold]", n_samples)
+        return len(columns)
     except ValueError:
-        console.print(f"[bold]Number of samples: [/bold]1")
+        return 1
 
-def start_refgen_header(header, target_file):
+def start_refgen_header(header, result):
     """
     Parses the information of the VCF header. If the contig information is present, it is used to infer the reference genome. 
-    If not, a message is printed and the inference is done with the variants information. If the gVCF tag is present in the header, it is also reported.
+    If not, it is noted in the result and the inference is done with the variants information. If the gVCF tag is present in the header, it is also reported.
     Args:        
         header: list of lines in the header of the VCF file
-        target_file: path of the input file, used for the messages
+        result: result of the input file
     Returns:
         The reference genome inferred by the contig header information, if the file is gVCF according to the header
     """
@@ -311,66 +678,168 @@ def start_refgen_header(header, target_file):
 
             if contig_id is not None and contig_length is not None:
                 dict_contigs[contig_id] = contig_length
-        comparison(dict_contigs, target_file)  # run the next f
+        comparison(dict_contigs, result)  # run the next f
 
     else:
-        console.print("[dark_orange]Contig information not in the header[/dark_orange] - [bold dark_orange]The reference genome can't be "
-                      "inferred from the header information [/bold dark_orange]")
+        result.message = "Contig information not in the header"
         
     
     gVCF= [line for line in header if '##ALT=<ID=NON_REF' in line]
-    if gVCF:
-        console.print(f"[bold]gVCF according to header[/bold]")
+    result.gvcf_header = bool(gVCF)
+    return result
         
 
-def extract_header(complete_file, input_file):
+def extract_header(complete_file, result):
     """
     If present, extracts header and send it to match the refgenDetector database
     Args:        
-        complete_file: opened file with the header
-        Input_file: path of the input file, used for the messages
+        complete_file: opened binary stream with the header
+        result: result of the input file, filled with the reference genome inferred by the contig header information
     Returns:
-        The reference genome inferred by the contig header information 
+        The first line after the header (bytes), the first record, or b"" if the file has no records
     """
     header = []
+    first_record = b""
     for line in complete_file:
-        if line.startswith('#'):
-            header.append(line.strip())
+        if line.startswith(b'#'):
+            header.append(line.decode("utf-8", "replace").strip())
         else:
+            first_record = line
             break
 
-    start_refgen_header(header, input_file)
-    get_n_samples(header)
+    start_refgen_header(header, result)
+    result.n_samples = get_n_samples(header)
+    return first_record
 
     
 
-def open_vcf(input_file, n_matches, max_n_var):
+def open_vcf(input_file, n_matches, max_n_var, result=None, verbose=False, use_index=True, threads=None,
+             error_rate=ERROR_RATE, opened=None):
     """
-    Parse arguments and open the input VCF, compressed or not.
+    Parse arguments and open the input VCF, compressed or not, or BCF. Pipes, the standard input ("-") and files
+    already opened to tell their type apart (and without an index) are read by open_vcf_stream(). A bgzipped VCF or a
+    BCF with a tabix or CSI index is sampled through its index (see sample_indexed()) unless use_index is False.
+    Otherwise bgzipped VCFs are inflated by a pool of threads (see bgzf.py) and BCFs are read by htslib with as many
+    threads (see read_variants()).
     Args:
          input_file: path of the input file
          n_matches (int | None): if provided, the function will stop reading more chunks once the total number of matches reaches. By default, 5000 matches are required before stopping. 
-         max_n_var (int | None): if provided, the function will stop reading more chunks once the total number of variants read exceeds this value. If None, read all chunks.
+         max_n_var (int | None): if provided, the function will stop reading once this number of variants is read. If None, read all chunks.
+         result (InferenceResult): result of the input file, created if not given
+         verbose (bool): print the progress of the scan (interactive mode)
+         use_index (bool): sample indexed VCFs through their index instead of reading them from the start
+         threads (int | None): threads inflating a bgzipped VCF or a BCF, bgzf.default_threads() if None
+         error_rate (float | None): stop reading once the inferred version is wrong with at most this probability (see is_decisive()). If None, only n_matches and max_n_var stop the scan.
+         opened (tuple | None): first bytes and stream of the file if already opened by inputs.open_input()
 
     Returns:
-        Calls the function to extract the header and the function to extract the columns of interest and infer the reference genome. The inference is done with the matches collected until the stopping condition is met (if any).
+        result (InferenceResult) with the reference genome inferred from the header and from the REF column. The inference is done with the matches collected until the stopping condition is met (if any).
     """
 
-    formats = ("vcf")
-    compressed_formats = ("vcf.gz") ##TODO whem bgz read_chunks and possible read_and_load take a long time
+    if result is None:
+        result = InferenceResult(input_file, "VCF")
+    if is_stream(input_file):
+        return open_vcf_stream(input_file, n_matches, max_n_var, result, verbose, threads, error_rate, opened)
 
+    index_path = find_index(input_file) if use_index else None
+    if opened is not None:
+        if index_path is None:
+            return open_vcf_stream(input_file, n_matches, max_n_var, result, verbose, threads, error_rate, opened)
+        opened[1].close()  # sampled through the index, by htslib
+
+    formats = ("vcf")
+    compressed_formats = ("vcf.gz")
+    binary_formats = ("bcf")
     if input_file.endswith(compressed_formats):
-        with gzip.open(input_file, "rt") as complete_file:
-            extract_header(complete_file, input_file)
-            extract_columns(complete_file, n_matches, max_n_var)
+        with open_compressed(input_file, threads, "rb") as complete_file:
+            first_record = extract_header(complete_file, result)
+            if index_path is not None:
+                sample_indexed(input_file, index_path, result, n_matches, max_n_var, verbose, error_rate)
+            else:
+                extract_columns(complete_file, result, n_matches, max_n_var, verbose, first_record, error_rate)
 
     elif input_file.endswith(formats):
-        with open(input_file, "rt") as complete_file:
-            extract_header(complete_file, input_file)
-            extract_columns(complete_file, n_matches, max_n_var)
+        with open(input_file, "rb") as complete_file:
+            first_record = extract_header(complete_file, result)
+            extract_columns(complete_file, result, n_matches, max_n_var, verbose, first_record, error_rate)
+    elif input_file.endswith(binary_formats):
+        open_bcf(input_file, result, n_matches, max_n_var, verbose, threads, error_rate, index_path)
     else: 
-        console.print(f"[bold][red] Only Formats Allowed: vcf and vcf.gz [/red][/bold]")
+        result.status = "error"
+        result.message = "Only Formats Allowed: vcf, vcf.gz and bcf"
+    return result
+
+
+def open_bcf(source, result, n_matches, max_n_var, verbose=False, threads=None, error_rate=ERROR_RATE,
+             index_path=None):
+    """
+    Reads a BCF with htslib: the contigs of its header and the REF column of its records (see read_variants()),
+    sampled through its index if it has one (see sample_indexed()).
+    Args:
+        source (str | int): path to the BCF, or file descriptor of a pipe with its content (see inputs.pipe_to_fd())
+        result (InferenceResult): result of the file
+        n_matches, max_n_var, verbose, error_rate: stopping conditions of the scan, see open_vcf()
+        threads (int | None): threads decompressing the BCF, bgzf.default_threads() if None
+        index_path (str | None): path to the .csi index of the BCF
 
+    Returns:
+        result (InferenceResult) with the reference genome inferred from the header and from the REF column
+    """
+    import pysam
 
+    threads = default_threads() if threads is None else threads
+    save = pysam.set_verbosity(0)  # htslib warns on unindexed BCFs and loose headers
+    try:
+        # A file descriptor is owned by the VariantFile, so the copy into the pipe stops when it's closed
+        variants = pysam.VariantFile(source, drop_samples=True, threads=threads,
+                                     duplicate_filehandle=isinstance(source, str))
+    except (OSError, ValueError) as e:
+        return bcf_error(result, e)
+    finally:
+        pysam.set_verbosity(save)
+    with variants:
+        header = str(variants.header).splitlines()
+        start_refgen_header(header, result)
+        result.n_samples = get_n_samples(header)
+        if index_path is not None:
+            return sample_indexed(source, index_path, result, n_matches, max_n_var, verbose, error_rate)
+        return read_variants(variants, result, n_matches, max_n_var, verbose, error_rate)
 
 
+def bcf_error(result, error):
+    """
+    Reports in the result a BCF htslib can't open, e.g. truncated or not a BCF.
+    """
+    result.status = "error"
+    result.message = (f"The file {result.file} can't be read as a BCF ({error})."
+                      f"\nRun refgenDetector -h to get more information about the usage of the tool.")
+    return result
+
+
+def open_vcf_stream(input_file, n_matches, max_n_var, result, verbose=False, threads=None, error_rate=ERROR_RATE,
+                    opened=None):
+    """
+    Reads a VCF or BCF from a pipe or the standard input ("-"), e.g. the output of bcftools view, or a file without
+    index already opened to tell its type apart. The format is told apart from the first bytes of the stream (plain,
+    gzip or BGZF VCF, BCF), not from an extension, and the stream is read once from the start, without an index. Only
+    the BCFs of pipes are copied to htslib through another pipe (see inputs.pipe_to_fd()); a BCF on disk is given to
+    htslib by its path.
+    Args:
+        input_file (str): path of the file or named pipe, or "-" for the standard input
+        n_matches, max_n_var, result, verbose, threads, error_rate, opened: see open_vcf()
+
+    Returns:
+        result (InferenceResult) with the reference genome inferred from the header and from the REF column
+    """
+    prefix, raw = opened or open_input(input_file)
+    with raw:
+        compression, content = content_prefix(prefix)
+        if content.startswith(BCF_MAGIC):
+            if not is_stream(input_file):
+                raw.close()  # a BCF on disk is opened by htslib itself, without copying it through a pipe
+                return open_bcf(input_file, result, n_matches, max_n_var, verbose, threads, error_rate)
+            return open_bcf(pipe_to_fd(raw), result, n_matches, max_n_var, verbose, threads, error_rate)
+        with (open_compressed(raw, threads, "rb", compression == "bgzf") if compression else raw) as complete_file:
+            first_record = extract_header(complete_file, result)
+            extract_columns(complete_file, result, n_matches, max_n_var, verbose, first_record, error_rate)
+    return result
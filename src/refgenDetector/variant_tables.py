@@ -0,0 +1,437 @@
+"""
+Reference tables used to infer the reference genome from the REF column of a VCF.
+
+Each msgpack ({version}-{chr}.msgpack) maps the positions of one chromosome, where the genome versions differ, to
+the base of that version. The msgpacks of a chromosome are merged into one table holding the sorted union of their
+positions and, for each position, the base of every genome version. Every table is recorded in the manifest of the
+tables (see table_manifest.py) and `refgenDetector-manager build-tables` converts all of them at once; otherwise a
+chromosome is converted the first time it's needed.
+
+Tables are stored packed, about 2.5 bytes per position with four versions plus the prefilter, as NumPy arrays saved
+in tables/:
+    prefilter        1 bit per base from the first to the last position of the table, set at the positions present
+    anchors          int64, first position of each block of at most BLOCK_ROWS positions
+    block_starts     int64, first row of each block
+    deltas           uint8, distance of each position to the previous one in its block (0 for the first one). A
+                     block ends before a distance that doesn't fit in one byte.
+    codes            2 bits per cell (row x version, row major): A, C, G, T, or the kind of escape
+    escapes          1 bit per cell: the base isn't A, C, G or T and its 2 bits mean no base, N, - or another code
+    exception_cells  int64, sorted cells with another code (IUPAC ambiguity codes...)
+    exception_bases  uint8, ASCII code of those cells
+
+The arrays are memory mapped and searched in place. A chunk of SNPs is first reduced with the prefilter to the
+positions present in the table, discarding most of the variants of a VCF, then the candidates locate their blocks with one
+np.searchsorted over the anchors, only those blocks are decoded, and one lookup returns the bases of all the versions
+at once. The pages of the blocks no candidate falls in are never read.
+"""
+
+import os
+from bisect import bisect_left
+import numpy as np
+try:
+    # Works when installed as a pip package
+    from .table_manifest import (MSGPACK_DIR, TABLES_DIR, new_manifest, read_manifest, write_manifest, table_entry,
+                                 record_table, is_current)
+except ImportError:
+    # Works when run directly as a script
+    from table_manifest import (MSGPACK_DIR, TABLES_DIR, new_manifest, read_manifest, write_manifest, table_entry,
+                                record_table, is_current)
+
+# Column order of the tables. A new build only needs its msgpacks and its name here.
+GENOME_VERSIONS = ["hg18", "GRCh37", "GRCh38", "T2T"]
+
+TABLE_ARRAYS = ["prefilter", "anchors", "block_starts", "deltas", "codes", "escapes", "exception_cells",
+                "exception_bases"]
+BLOCK_ROWS = 128
+MAX_DELTA = np.iinfo(np.uint8).max
+
+# 2 bit code -> ASCII code, for cells without and with the escape bit. Escaped code 0 is "no base" and 3 "another
+# code", looked up in the exceptions.
+CODE_BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+ESCAPE_BASES = np.array([0, ord("N"), ord("-"), 0], dtype=np.uint8)
+BASE_CODES = np.full(256, 3, dtype=np.uint8)
+BASE_CODES[CODE_BASES] = np.arange(4)
+BASE_CODES[ESCAPE_BASES[:3]] = np.arange(3)
+
+
+def table_paths(chromosome, tables_dir=TABLES_DIR):
+    """
+    Returns the path of each array of the table of a chromosome, e.g. "chrY", in the order of TABLE_ARRAYS.
+    """
+    return [os.path.join(tables_dir, f"{chromosome}.{array_name}.npy") for array_name in TABLE_ARRAYS]
+
+
+def chromosome_sources(chromosome, msgpack_dir=MSGPACK_DIR):
+    """
+    Returns the msgpacks of a chromosome as a list of (version, path), in the order of GENOME_VERSIONS.
+    """
+    sources = [(version, os.path.join(msgpack_dir, f"{version}-{chromosome}.msgpack")) for version in GENOME_VERSIONS]
+    return [(version, path) for version, path in sources if os.path.exists(path)]
+
+
+def read_msgpack(msgpack_path):
+    """
+    Reads a msgpack (position: base) into arrays.
+    Returns:
+        positions (np.ndarray, int64) and bases (np.ndarray, uint8 ASCII codes), in the order of the msgpack
+    """
+    import msgpack  # only needed to convert the msgpacks, not to read the tables
+
+    with open(msgpack_path, "rb") as f:
+        ref_dict = msgpack.load(f, raw=False, strict_map_key=False)
+    positions = np.fromiter(ref_dict.keys(), dtype=np.int64, count=len(ref_dict))
+    bases = np.frombuffer("".join(ref_dict.values()).encode("ascii"), dtype=np.uint8)
+    if len(bases) != len(positions):
+        raise ValueError(f"{msgpack_path} holds values that are not single bases.")
+    return positions, bases
+
+
+def pack_prefilter(positions):
+    """
+    Builds the bitmap of the positions of a table, bit i (little endian within each byte) for position
+    positions[0] + i.
+    Returns:
+        prefilter (np.ndarray, uint8)
+    """
+    if len(positions) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    offsets = positions - positions[0]
+    prefilter = np.zeros(int(offsets[-1]) // 8 + 1, dtype=np.uint8)
+    byte_index = offsets >> 3
+    bits = (1 << (offsets & 7)).astype(np.uint8)
+    first_of_byte = np.flatnonzero(np.concatenate(([True], byte_index[1:] != byte_index[:-1])))
+    prefilter[byte_index[first_of_byte]] = np.bitwise_or.reduceat(bits, first_of_byte)
+    return prefilter
+
+
+def pack_positions(positions):
+    """
+    Delta encodes sorted positions in blocks.
+    Returns:
+        anchors (np.ndarray, int64), block_starts (np.ndarray, int64) and deltas (np.ndarray, uint8)
+    """
+    gaps = np.diff(positions, prepend=positions[:1])
+    breaks = gaps > MAX_DELTA
+    breaks[:1] = True
+    # Blocks also end every BLOCK_ROWS rows, counted from the last break
+    segment_starts = np.flatnonzero(breaks)
+    rows_in_segment = np.arange(len(positions)) - segment_starts[np.cumsum(breaks) - 1]
+    new_block = breaks | (rows_in_segment % BLOCK_ROWS == 0)
+    block_starts = np.flatnonzero(new_block)
+    deltas = np.where(new_block, 0, gaps).astype(np.uint8)
+    return positions[block_starts].astype(np.int64), block_starts.astype(np.int64), deltas
+
+
+def pack_bases(bases):
+    """
+    Packs a matrix of bases (one row per position, one column per version) into 2 bit codes and the escape mask.
+    Returns:
+        codes, escapes, exception_cells and exception_bases arrays
+    """
+    cells = bases.reshape(-1)
+    codes = BASE_CODES[cells]
+    escaped = ~np.isin(cells, CODE_BASES)
+    exception_cells = np.flatnonzero(escaped & (codes == 3)).astype(np.int64)
+    padded = np.zeros(-(-len(codes) // 4) * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    padded = padded.reshape(-1, 4)
+    packed_codes = padded[:, 0] | (padded[:, 1] << 2) | (padded[:, 2] << 4) | (padded[:, 3] << 6)
+    return packed_codes, np.packbits(escaped, bitorder="little"), exception_cells, cells[exception_cells]
+
+
+def merge_msgpacks(sources):
+    """
+    Merges the msgpacks of one chromosome into a packed table.
+    Args:
+        sources (list): (version, path) of each msgpack, as returned by chromosome_sources()
+
+    Returns:
+        table (dict): "versions" (list of the versions, one column each), "rows" (number of positions) and the
+        arrays of TABLE_ARRAYS
+    """
+    columns = [read_msgpack(path) for _, path in sources]
+    positions = np.sort(np.concatenate([column_positions for column_positions, _ in columns]))
+    positions = positions[np.concatenate(([True], positions[1:] != positions[:-1]))]  # union, without duplicates
+    bases = np.zeros((len(positions), len(columns)), dtype=np.uint8)
+    for i, (column_positions, column_bases) in enumerate(columns):
+        bases[np.searchsorted(positions, column_positions), i] = column_bases
+    del columns
+
+    table = {"versions": [version for version, _ in sources], "rows": len(positions)}
+    table.update(zip(TABLE_ARRAYS, (pack_prefilter(positions),) + pack_positions(positions) + pack_bases(bases)))
+    return table
+
+
+def save_array(path, array):
+    """
+    Saves an array next to its final path and renames it, so a process reading the table never sees it half written.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def save_table(chromosome, table, sources, tables_dir=TABLES_DIR):
+    """
+    Saves the arrays of a table.
+    Args:
+        chromosome (str): chromosome of the table
+        table (dict): table returned by merge_msgpacks()
+        sources (list): (version, path) of the msgpacks merged
+        tables_dir (str): directory where the arrays are saved
+
+    Returns:
+        entry (dict) of the table for the manifest
+    """
+    paths = table_paths(chromosome, tables_dir)
+    for array_name, path in zip(TABLE_ARRAYS, paths):
+        save_array(path, table[array_name])
+    return table_entry(table["rows"], table["versions"], [path for _, path in sources], paths)
+
+
+def map_table(chromosome, entry, tables_dir=TABLES_DIR):
+    """
+    Memory maps the arrays of a table listed in the manifest.
+    Returns:
+        table (dict), or None if an array is missing or doesn't match the entry of the manifest
+    """
+    table = {"versions": entry["versions"], "rows": entry["rows"]}
+    try:
+        for array_name, path in zip(TABLE_ARRAYS, table_paths(chromosome, tables_dir)):
+            table[array_name] = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    n_cells = entry["rows"] * len(entry["versions"])
+    if (len(table["deltas"]) != entry["rows"] or len(table["codes"]) != -(-n_cells // 4)
+            or len(table["escapes"]) != -(-n_cells // 8) or (len(table["prefilter"]) == 0) != (entry["rows"] == 0)):
+        return None
+    return table
+
+
+def table_nbytes(table):
+    """
+    Bytes of the arrays of a table, 0 for a chromosome without table (None).
+    """
+    return 0 if table is None else sum(table[array_name].nbytes for array_name in TABLE_ARRAYS)
+
+
+def load_table(chromosome, msgpack_dir=MSGPACK_DIR, tables_dir=TABLES_DIR):
+    """
+    Loads the table of a chromosome. If it isn't in the manifest, its files don't match the manifest or its msgpacks
+    changed, the msgpacks are merged (once) and the table added to the manifest. If it can't be written (e.g.
+    read-only installation) the table packed in memory is used.
+    Args:
+        chromosome (str): chromosome of the table, e.g. "chr21"
+        msgpack_dir (str): directory with the msgpacks
+        tables_dir (str): directory with the converted tables
+
+    Returns:
+        table (dict) as returned by merge_msgpacks(), with the arrays memory mapped when possible, or None if there
+        are no msgpacks for the chromosome
+    """
+    sources = chromosome_sources(chromosome, msgpack_dir)
+    source_files = [os.path.basename(path) for _, path in sources]
+    manifest = read_manifest(tables_dir)
+    entry = manifest["tables"].get(chromosome) if manifest else None
+    if entry is not None and is_current(entry, msgpack_dir) and (
+            not sources or source_files == [source["file"] for source in entry["sources"]]):
+        table = map_table(chromosome, entry, tables_dir)
+        if table is not None:
+            return table
+
+    if not sources:
+        return None
+    table = merge_msgpacks(sources)
+    try:
+        os.makedirs(tables_dir, exist_ok=True)
+        entry = save_table(chromosome, table, sources, tables_dir)
+        record_table(chromosome, entry, tables_dir)
+    except OSError:
+        return table
+    return map_table(chromosome, entry, tables_dir) or table
+
+
+def build_tables(msgpack_dir=MSGPACK_DIR, tables_dir=TABLES_DIR, verbose=False):
+    """
+    Merges the msgpacks of every chromosome into its table, writes a new manifest with all of them and removes the
+    arrays of previous conversions that are no longer used.
+    Args:
+        msgpack_dir (str): directory with the msgpacks
+        tables_dir (str): directory where the tables and the manifest are written
+        verbose (bool): print each table converted
+
+    Returns:
+        manifest (dict) written
+    """
+    chromosomes = set()
+    for file_name in os.listdir(msgpack_dir):
+        version, _, chromosome = file_name[:-len(".msgpack")].partition("-")
+        if file_name.endswith(".msgpack") and version in GENOME_VERSIONS:
+            chromosomes.add(chromosome)
+
+    os.makedirs(tables_dir, exist_ok=True)
+    manifest = new_manifest()
+    for chromosome in sorted(chromosomes):
+        sources = chromosome_sources(chromosome, msgpack_dir)
+        manifest["tables"][chromosome] = save_table(chromosome, merge_msgpacks(sources), sources, tables_dir)
+        if verbose:
+            print(f"  {chromosome}: {manifest['tables'][chromosome]['rows']} positions, "
+                  f"{', '.join(manifest['tables'][chromosome]['versions'])}")
+    write_manifest(manifest, tables_dir)
+
+    in_use = {file_name for entry in manifest["tables"].values() for file_name in entry["files"]}
+    for file_name in os.listdir(tables_dir):
+        if file_name.endswith(".npy") and file_name not in in_use:
+            os.remove(os.path.join(tables_dir, file_name))
+    return manifest
+
+
+def encode_bases(nucleotides):
+    """
+    Converts the REF values of the SNPs into the uint8 ASCII codes compared with the tables. Only the first character
+    is kept, values longer than one base (e.g. <NON_REF>) become 255, a code no table holds.
+    """
+    nucleotides = np.asarray(nucleotides, dtype=str)
+    code_points = nucleotides.astype("U1").view(np.uint32)  # one UCS4 code point per value
+    single_ascii = (np.char.str_len(nucleotides) == 1) & (code_points > 0) & (code_points < 128)
+    return np.where(single_ascii, code_points, 255).astype(np.uint8)
+
+
+def prefilter_positions(table, positions):
+    """
+    Tests positions against the prefilter of a table, without reading the rest of the table.
+    Returns:
+        candidates (np.ndarray, bool): positions present in the table
+    """
+    candidates = np.zeros(len(positions), dtype=bool)
+    if table["rows"] == 0:
+        return candidates
+    offsets = positions - table["anchors"][0]
+    inside = (offsets >= 0) & (offsets < len(table["prefilter"]) * 8)
+    offsets = offsets[inside]
+    candidates[inside] = (table["prefilter"][offsets >> 3] >> (offsets & 7).astype(np.uint8)) & 1
+    return candidates
+
+
+def find_rows(table, positions):
+    """
+    Finds the rows of sorted positions in a table, decoding only the blocks they fall in.
+    Args:
+        table (dict): table returned by load_table()
+        positions (np.ndarray): sorted positions, int64
+
+    Returns:
+        found (np.ndarray, bool): positions present in the table
+        rows (np.ndarray, int64): row of each position found
+    """
+    anchors, block_starts = table["anchors"], table["block_starts"]
+    block = np.searchsorted(anchors, positions, side="right") - 1
+    blocks = np.unique(block[block >= 0])
+    if len(blocks) == 0:
+        return np.zeros(len(positions), dtype=bool), np.zeros(0, dtype=np.int64)
+
+    # Rows of the blocks, concatenated, and their positions: anchor of the block plus the running sum of the deltas
+    starts = block_starts[blocks]
+    ends = np.append(block_starts, table["rows"])[blocks + 1]
+    lengths = ends - starts
+    first = np.cumsum(lengths) - lengths
+    rows = np.arange(lengths.sum()) + np.repeat(starts - first, lengths)
+    running = np.cumsum(table["deltas"][rows], dtype=np.int64)
+    decoded = np.repeat(anchors[blocks] - running[first], lengths) + running
+
+    index = np.minimum(np.searchsorted(decoded, positions), len(decoded) - 1)
+    found = decoded[index] == positions
+    return found, rows[index[found]]
+
+
+def decode_bases(table, rows):
+    """
+    Decodes the bases of all the versions for some rows of a table.
+    Returns:
+        bases (np.ndarray): uint8 ASCII matrix, one row per row given and one column per version (0 for no base)
+    """
+    cells = rows[:, None] * len(table["versions"]) + np.arange(len(table["versions"]))
+    codes = (table["codes"][cells >> 2] >> ((cells & 3) << 1).astype(np.uint8)) & 3
+    escaped = ((table["escapes"][cells >> 3] >> (cells & 7).astype(np.uint8)) & 1).astype(bool)
+    bases = np.where(escaped, ESCAPE_BASES[codes], CODE_BASES[codes])
+    exceptions = escaped & (codes == 3)
+    if exceptions.any():
+        bases[exceptions] = table["exception_bases"][np.searchsorted(table["exception_cells"], cells[exceptions])]
+    return bases
+
+
+def match_rows(table, positions, bases):
+    """
+    Tells, for every SNP and every version of the table, if the REF base of the SNP is the base of that version at
+    the same position.
+    Args:
+        table (dict): table returned by load_table()
+        positions (np.ndarray): sorted positions of the SNPs, int64, without duplicates
+        bases (np.ndarray): REF bases of the SNPs, encoded by encode_bases()
+
+    Returns:
+        matched (np.ndarray, bool): one row per SNP and one column per version, in the order of table["versions"]
+    """
+    matched = np.zeros((len(positions), len(table["versions"])), dtype=bool)
+    candidates = prefilter_positions(table, positions)
+    if candidates.any():
+        found, rows = find_rows(table, positions[candidates])
+        snps = np.flatnonzero(candidates)[found]
+        matched[snps] = decode_bases(table, rows) == bases[snps, None]
+    return matched
+
+
+def count_matches(table, positions, bases):
+    """
+    Counts, for every version of the table, the SNPs whose REF base is the base of that version at the same position
+    (see match_rows()).
+    Returns:
+        Number of matches of each version (np.ndarray), in the order of table["versions"]
+    """
+    return np.count_nonzero(match_rows(table, positions, bases), axis=0)
+
+
+def spread_fractions(n):
+    """
+    First n terms of the base 2 van der Corput sequence (0, 1/2, 1/4, 3/4, 1/8...): each prefix of the sequence is
+    spread evenly over [0, 1).
+    """
+    fractions = []
+    for i in range(n):
+        fraction, denominator = 0.0, 1.0
+        while i:
+            denominator *= 2
+            fraction += (i & 1) / denominator
+            i >>= 1
+        fractions.append(fraction)
+    return fractions
+
+
+def sampling_windows(table, n_windows, window_bp):
+    """
+    Chooses windows to sample a chromosome where its table is dense. The windows start at the first position of
+    blocks of the table picked evenly over the blocks, and every block holds up to BLOCK_ROWS positions, so dense
+    regions hold more blocks and get more windows. Windows overlapping a previous one are dropped.
+    Args:
+        table (dict): table returned by load_table()
+        n_windows (int): number of windows to choose
+        window_bp (int): length of each window
+
+    Returns:
+        starts (list[int]): 1-based start of each window, in sampling order: any prefix of the list is spread along
+        the chromosome
+    """
+    anchors = table["anchors"]
+    if len(anchors) == 0:
+        return []
+    blocks = (np.array(spread_fractions(n_windows)) * len(anchors)).astype(np.int64)
+    starts = []
+    taken = []  # sorted starts, to drop overlapping windows
+    for start in anchors[blocks].tolist():
+        i = bisect_left(taken, start)
+        if (i < len(taken) and taken[i] - start < window_bp) or (i > 0 and start - taken[i - 1] < window_bp):
+            continue
+        taken.insert(i, start)
+        starts.append(start)
+    return starts
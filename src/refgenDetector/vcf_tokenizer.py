@@ -0,0 +1,341 @@
+"""
+Tokenizer of the records of a VCF (or of a PLINK .bim/.pvar), on raw bytes and with NumPy.
+
+Only the first five columns (CHROM, POS, ID, REF, ALT) are needed to infer the reference genome, but a line of a
+cohort VCF holds thousands of sample columns. The lines of a block of bytes are found with one vectorized search
+of the newlines, and only the first WINDOW bytes of each line are looked at to find its first five tabs: the sample
+columns are never tokenized nor decoded. Other layouts give the columns of CHROM, POS, REF and ALT (BIM_COLUMNS: A1
+and A2 of a .bim in place of REF and ALT). Each block becomes a few NumPy arrays, without one Python object per
+field:
+
+    chrom        int32, code of the CHROM of each record, an index of the list of names given to tokenize()
+    pos          int64, POS
+    ref, alt     uint8, first base of REF and of ALT, upper case
+    ref_len      int64, length of REF
+    alt_len      int64, length of ALT
+    alt_non_ref  bool, ALT is <NON_REF>
+    has_non_ref  bool, ALT includes <NON_REF> (gVCF)
+
+Lines whose last needed tab is further than WINDOW bytes (e.g. very long alleles) are tokenized one by one in Python.
+
+The memory used is bounded by a budget whatever the shape of the VCF: the blocks read, the lines tokenized at once and
+the records of each chunk take a fixed share of it, and the records per chunk follow the bytes per line observed
+(see chunk_rows()), so a chunk of a sites-only VCF holds many more records than a chunk of a cohort VCF. The first
+chunk holds FIRST_CHUNK_ROWS records and each next one twice as many up to that cap, so a scan that stops after a few
+thousand records (the build is clear early) doesn't read and tokenize a whole chunk of the budget first.
+
+The records of a BCF, already split into fields by htslib, are turned into the same arrays by site_records().
+"""
+
+import re
+from itertools import islice
+import numpy as np
+
+WINDOW = 512
+MAX_BLOCK_BYTES = 8 << 20
+CELL_BYTES = 16  # bytes per byte of the window while tokenizing (window, indices, tab counts)
+RECORD_BYTES = 128  # bytes per record of a chunk, with the temporaries of its matching
+SITE_BYTES = 512  # bytes per site read by htslib and held in Python until its chunk is built
+MIN_CHUNK_ROWS = 100
+FIRST_CHUNK_ROWS = 4096
+NON_REF = b"<NON_REF>"
+NON_REF_PATTERN = re.compile(re.escape(NON_REF))
+VCF_COLUMNS = (0, 1, 3, 4)  # CHROM, POS, REF, ALT
+BIM_COLUMNS = (0, 3, 4, 5)  # chromosome, position, A1, A2
+RECORD_FIELDS = ["chrom", "pos", "ref", "alt", "ref_len", "alt_len", "alt_non_ref", "has_non_ref"]
+
+NEWLINE, TAB, CARRIAGE_RETURN, HASH = ord("\n"), ord("\t"), ord("\r"), ord("#")
+
+
+def empty_records():
+    return {"chrom": np.zeros(0, dtype=np.int32), "pos": np.zeros(0, dtype=np.int64),
+            "ref": np.zeros(0, dtype=np.uint8), "alt": np.zeros(0, dtype=np.uint8),
+            "ref_len": np.zeros(0, dtype=np.int64), "alt_len": np.zeros(0, dtype=np.int64),
+            "alt_non_ref": np.zeros(0, dtype=bool), "has_non_ref": np.zeros(0, dtype=bool)}
+
+
+def chrom_codes(keys, names):
+    """
+    Converts the CHROM of the records (fixed width bytes) into codes, adding new chromosomes to names.
+    """
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    codes = {name: code for code, name in enumerate(names)}
+    unique_codes = []
+    for key in unique_keys.tolist():
+        name = key.decode("utf-8", "replace")
+        if name not in codes:
+            codes[name] = len(names)
+            names.append(name)
+        unique_codes.append(codes[name])
+    return np.array(unique_codes, dtype=np.int32)[inverse.reshape(-1)]
+
+
+def parse_positions(digits, lengths):
+    """
+    Parses POS from a matrix of bytes, one row per record and lengths[i] digits in row i.
+    Raises:
+        ValueError if a POS isn't a number
+    """
+    width = digits.shape[1]
+    inside = np.arange(width) < lengths[:, None]
+    values = digits.astype(np.int64) - ord("0")
+    if ((values < 0) | (values > 9))[inside].any() or (lengths == 0).any() or (lengths > 18).any():
+        raise ValueError("POS column is not a number, please check your input file. Stopping scan.")
+    # Right align the digits so every column has the same power of ten
+    values = np.where(inside, values, 0)
+    powers = np.where(inside, 10 ** np.clip(lengths[:, None] - 1 - np.arange(width), 0, 18), 0)
+    return (values * powers).sum(axis=1)
+
+
+def tokenize_slow(line, names, columns=VCF_COLUMNS):
+    """
+    Tokenizes one record in Python, for the lines the vectorized tokenizer can't (last needed tab beyond WINDOW).
+    """
+    n_fields = max(columns) + 1
+    fields = line.rstrip(b"\r").split(b"\t", n_fields)
+    fields += [b""] * (n_fields - len(fields[:n_fields]))
+    chrom, pos, ref, alt = (fields[column] for column in columns)
+    name = chrom.decode("utf-8", "replace")
+    if name not in names:
+        names.append(name)
+    if not pos.isdigit():
+        raise ValueError("POS column is not a number, please check your input file. Stopping scan.")
+    return (names.index(name), int(pos), ref[:1].upper()[0] if ref else 0, alt[:1].upper()[0] if alt else 0,
+            len(ref), len(alt), alt == NON_REF, NON_REF in alt)
+
+
+def tokenize(buffer, names, memory_bytes=None, columns=VCF_COLUMNS):
+    """
+    Tokenizes the records of a block of complete lines.
+    Args:
+        buffer (bytes): lines of a VCF, the last one ended by a newline. Header lines are skipped.
+        names (list[str]): names of the chromosomes already seen, extended with the new ones
+        memory_bytes (int | None): memory available to tokenize, the lines are tokenized in slices that fit in it.
+                                   If None, all at once.
+        columns (tuple[int]): columns of CHROM, POS, REF and ALT, VCF_COLUMNS or BIM_COLUMNS
+
+    Returns:
+        records (dict) with the arrays of RECORD_FIELDS, one value per record
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    ends = np.flatnonzero(data == NEWLINE)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    ends = ends - ((ends > starts) & (data[np.maximum(ends - 1, 0)] == CARRIAGE_RETURN))
+    keep = (ends > starts) & (data[starts] != HASH)
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return empty_records()
+
+    width = int(min(WINDOW, (ends - starts).max()))
+    step = len(starts) if memory_bytes is None else max(1, memory_bytes // (width * CELL_BYTES))
+    return concatenate_records([tokenize_lines(buffer, data, starts[i:i + step], ends[i:i + step], names, columns)
+                                for i in range(0, len(starts), step)])
+
+
+def tokenize_lines(buffer, data, starts, ends, names, columns=VCF_COLUMNS):
+    """
+    Tokenizes the records of the lines between starts and ends (data lines only), see tokenize().
+    """
+    lengths = ends - starts
+    width = int(min(WINDOW, lengths.max()))
+    window_columns = np.arange(width)
+    index = starts[:, None] + window_columns
+    np.minimum(index, len(data) - 1, out=index)
+    window = data[index]
+    del index
+    tabs = (window == TAB) & (window_columns < lengths[:, None])
+    counts = np.cumsum(tabs, axis=1, dtype=np.int32)
+    n_tabs = counts[:, -1]
+    n_fields = max(columns) + 1
+    # Column of the k-th tab, or the end of the line if it has fewer tabs
+    tab = [np.where(n_tabs >= k, np.argmax(counts >= k, axis=1), lengths) for k in range(1, n_fields + 1)]
+    slow = (n_tabs < n_fields) & (lengths > width)
+    chrom_column, pos_column, ref_column, alt_column = columns
+    # First column of each field, and its length
+    field_start = [np.zeros(len(starts), dtype=np.int64)] + [column + 1 for column in tab[:-1]]
+    field_len = [np.maximum(tab[k] - field_start[k], 0) for k in range(n_fields)]
+
+    rows = np.arange(len(starts))
+    chrom_start = field_start[chrom_column]
+    chrom_len = np.clip(np.minimum(field_len[chrom_column], width - chrom_start), 0, None)
+    chrom_width = max(int(chrom_len.max()), 1)
+    chrom_columns = np.minimum(chrom_start[:, None] + np.arange(chrom_width), width - 1)
+    chrom_bytes = np.where(np.arange(chrom_width) < chrom_len[:, None], window[rows[:, None], chrom_columns], 0)
+    chrom = chrom_codes(np.ascontiguousarray(chrom_bytes, dtype=np.uint8).view(f"S{chrom_width}").reshape(-1), names)
+
+    pos_len = np.where(slow, 1, field_len[pos_column])
+    pos_width = max(int(pos_len.max()), 1)
+    pos_columns = np.minimum(field_start[pos_column][:, None] + np.arange(pos_width), width - 1)
+    pos_digits = np.where(slow[:, None], ord("0"), window[rows[:, None], pos_columns])
+    pos = parse_positions(pos_digits, pos_len)
+
+    ref_len = field_len[ref_column]
+    alt_len = field_len[alt_column]
+    alt_start = field_start[alt_column]
+    ref = window[rows, np.minimum(field_start[ref_column], width - 1)]
+    ref = np.where((ref >= ord("a")) & (ref <= ord("z")), ref - 32, ref).astype(np.uint8)
+    alt = window[rows, np.minimum(alt_start, width - 1)]
+    alt = np.where((alt >= ord("a")) & (alt <= ord("z")), alt - 32, alt).astype(np.uint8)
+    non_ref_columns = np.minimum(alt_start[:, None] + np.arange(len(NON_REF)), width - 1)
+    alt_non_ref = (alt_len == len(NON_REF)) & (window[rows[:, None], non_ref_columns] ==
+                                               np.frombuffer(NON_REF, dtype=np.uint8)).all(axis=1)
+
+    has_non_ref = np.zeros(len(starts), dtype=bool)
+    if NON_REF in buffer:
+        matches = NON_REF_PATTERN.finditer(buffer, int(starts[0]), int(ends[-1]))
+        offsets = np.array([match.start() for match in matches], dtype=np.int64)
+        row = np.searchsorted(starts, offsets, side="right") - 1
+        valid = row >= 0
+        offsets, row = offsets[valid], row[valid]
+        row_alt_start = starts[row] + alt_start[row]
+        inside_alt = (offsets >= row_alt_start) & (offsets + len(NON_REF) <= row_alt_start + alt_len[row])
+        has_non_ref[row[inside_alt]] = True
+
+    records = {"chrom": chrom, "pos": pos, "ref": ref, "alt": alt, "ref_len": ref_len.astype(np.int64),
+               "alt_len": alt_len.astype(np.int64), "alt_non_ref": alt_non_ref, "has_non_ref": has_non_ref}
+    for i in np.flatnonzero(slow).tolist():
+        values = tokenize_slow(buffer[starts[i]:ends[i]], names, columns)
+        for field, value in zip(RECORD_FIELDS, values):
+            records[field][i] = value
+    ref_null = records["ref"] == 0
+    records["ref"][ref_null] = 255  # never a base of the tables
+    return records
+
+
+def concatenate_records(parts):
+    if not parts:
+        return empty_records()
+    if len(parts) == 1:
+        return parts[0]
+    return {field: np.concatenate([part[field] for part in parts]) for field in RECORD_FIELDS}
+
+
+def slice_records(records, start, stop=None):
+    return {field: values[start:stop] for field, values in records.items()}
+
+
+def chunk_rows(bytes_per_row, memory_bytes):
+    """
+    Most records per chunk for lines of bytes_per_row bytes: the lines of a chunk add up to at most a quarter of the
+    memory budget, so the matches of wide VCFs are checked often, and the records of a chunk take at most an eighth
+    of it, as a few chunks are in flight at the same time (read ahead, queued and being matched).
+    """
+    by_memory = memory_bytes // 8 // RECORD_BYTES
+    by_input = int(memory_bytes // 4 // max(bytes_per_row, 1))
+    return max(MIN_CHUNK_ROWS, min(by_input, by_memory))
+
+
+def read_records(stream, names, memory_bytes, pending=b"", max_rows=None, columns=VCF_COLUMNS):
+    """
+    Reads the records of a VCF from a binary stream in chunks of FIRST_CHUNK_ROWS records, doubled after each chunk
+    up to the number of records adjusted to the bytes per line read so far (see chunk_rows()). The blocks read grow
+    alike, from 64 KB.
+    Args:
+        stream: binary stream positioned after the header (or anywhere: header lines are skipped)
+        names (list[str]): names of the chromosomes, extended as new ones are found
+        memory_bytes (int): memory budget of the reading, split between the block read, the tokenizer and the chunks
+        pending (bytes): bytes already read from the stream, e.g. the first record read with the header
+        max_rows (int | None): stop after this number of records. If None, read the whole stream.
+        columns (tuple[int]): columns of CHROM, POS, REF and ALT, VCF_COLUMNS or BIM_COLUMNS
+
+    Yields:
+        records (dict) of each chunk
+    """
+    max_block_bytes = max(1 << 16, min(MAX_BLOCK_BYTES, memory_bytes // 8))
+    block_bytes = 1 << 16
+    target = FIRST_CHUNK_ROWS
+    parts = []
+    n_rows = 0
+    rows_read = 0
+    bytes_read = 0
+    end_of_file = False
+    while not end_of_file:
+        block = stream.read(block_bytes)
+        block_bytes = min(max_block_bytes, 2 * block_bytes)
+        end_of_file = not block
+        data = pending + block
+        cut = len(data) if end_of_file else data.rfind(b"\n") + 1
+        pending = data[cut:]
+        lines = data[:cut]
+        if lines and not lines.endswith(b"\n"):
+            lines += b"\n"
+        if lines:
+            records = tokenize(lines, names, memory_bytes // 4, columns)
+            if max_rows is not None and rows_read + len(records["pos"]) >= max_rows:
+                records = slice_records(records, 0, max_rows - rows_read)
+                end_of_file = True
+            parts.append(records)
+            n_rows += len(records["pos"])
+            rows_read += len(records["pos"])
+            bytes_read += len(lines)
+        max_rows_per_chunk = chunk_rows(bytes_read / max(rows_read, 1), memory_bytes)
+        while n_rows >= min(target, max_rows_per_chunk) or (end_of_file and n_rows):
+            records = concatenate_records(parts)
+            size = min(target, max_rows_per_chunk, n_rows)
+            yield slice_records(records, 0, size)
+            parts = [slice_records(records, size)] if n_rows > size else []
+            n_rows -= size
+            target = min(2 * target, max_rows_per_chunk)
+
+
+def site_records(sites, names):
+    """
+    Records of sites already split into fields, e.g. read by htslib from a BCF.
+    Args:
+        sites (list[tuple]): CHROM (str), POS (int) and alleles (tuple[str] | None: REF and the ALTs) of each site
+        names (list[str]): names of the chromosomes already seen, extended with the new ones
+
+    Returns:
+        records (dict) with the arrays of RECORD_FIELDS, one value per site
+    """
+    if not sites:
+        return empty_records()
+    chroms, positions, alleles = zip(*sites)
+    codes = {name: code for code, name in enumerate(names)}
+    for name in dict.fromkeys(chroms):
+        if name not in codes:
+            codes[name] = len(names)
+            names.append(name)
+    refs = [site_alleles[0] if site_alleles else "" for site_alleles in alleles]
+    alts = [",".join(site_alleles[1:]) or "." if site_alleles else "." for site_alleles in alleles]
+    non_ref = NON_REF.decode()
+    return {"chrom": np.array([codes[name] for name in chroms], dtype=np.int32),
+            "pos": np.array(positions, dtype=np.int64),
+            "ref": first_bases(refs), "alt": first_bases(alts),
+            "ref_len": np.fromiter(map(len, refs), dtype=np.int64, count=len(refs)),
+            "alt_len": np.fromiter(map(len, alts), dtype=np.int64, count=len(alts)),
+            "alt_non_ref": np.array([alt == non_ref for alt in alts], dtype=bool),
+            "has_non_ref": np.array([non_ref in alt for alt in alts], dtype=bool)}
+
+
+def first_bases(alleles):
+    """
+    First base of each allele (str), upper case, as a byte (0 for an empty allele).
+    """
+    bases = np.array(alleles, dtype="U1").view(np.uint32)
+    bases = np.where((bases >= ord("a")) & (bases <= ord("z")), bases - 32, bases)
+    return np.minimum(bases, 255).astype(np.uint8)
+
+
+def read_sites(variants, names, memory_bytes, max_rows=None):
+    """
+    Reads the records of a file opened with htslib (pysam.VariantFile, without its samples) in chunks of the same
+    memory budget as read_records(), growing alike from FIRST_CHUNK_ROWS records.
+    Args:
+        variants: iterator of pysam.VariantRecord
+        names (list[str]): names of the chromosomes, extended as new ones are found
+        memory_bytes (int): memory budget of the reading
+        max_rows (int | None): stop after this number of records. If None, read the whole file.
+
+    Yields:
+        records (dict) of each chunk
+    """
+    max_rows_per_chunk = chunk_rows(SITE_BYTES, memory_bytes)
+    size = min(FIRST_CHUNK_ROWS, max_rows_per_chunk)
+    variants = iter(variants) if max_rows is None else islice(variants, max_rows)
+    while True:
+        sites = [(record.chrom, record.pos, record.alleles) for record in islice(variants, size)]
+        if not sites:
+            return
+        yield site_records(sites, names)
+        size = min(2 * size, max_rows_per_chunk)
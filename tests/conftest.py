@@ -0,0 +1,50 @@
+"""
+The modules are imported as when refgenDetector is run directly as a script (src/refgenDetector in the path), so
+importing them doesn't run the setup of the reference files done by the package on import.
+"""
+
+import os
+import sys
+from functools import partial
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "refgenDetector"))
+
+
+def write_msgpacks(msgpack_dir, chromosome, columns):
+    """
+    Writes one msgpack ({version}-{chromosome}.msgpack, position: base) per version.
+    Args:
+        msgpack_dir: directory of the msgpacks
+        chromosome (str): chromosome of the tables, e.g. "chr21"
+        columns (dict): version to a (positions, bases) pair, bases as one character strings
+    """
+    import msgpack
+
+    os.makedirs(msgpack_dir, exist_ok=True)
+    for version, (positions, bases) in columns.items():
+        with open(os.path.join(msgpack_dir, f"{version}-{chromosome}.msgpack"), "wb") as f:
+            msgpack.dump({int(position): str(base) for position, base in zip(positions, bases)}, f)
+
+
+@pytest.fixture
+def reference_tables(tmp_path, monkeypatch):
+    """
+    Builds reference tables from small msgpacks in a temporary directory and makes the VCF and PLINK scans use them.
+    Returns:
+        a function taking the chromosome and the columns of write_msgpacks(), which writes the msgpacks and, unless
+        convert is False, builds the tables and returns their manifest
+    """
+    import variant_files
+    import variant_tables
+
+    msgpack_dir, tables_dir = str(tmp_path / "msgpacks"), str(tmp_path / "tables")
+    monkeypatch.setattr(variant_files, "load_table",
+                        partial(variant_tables.load_table, msgpack_dir=msgpack_dir, tables_dir=tables_dir))
+
+    def build(chromosome, columns, convert=True):
+        write_msgpacks(msgpack_dir, chromosome, columns)
+        return variant_tables.build_tables(msgpack_dir, tables_dir) if convert else None
+
+    return build
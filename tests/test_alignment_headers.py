@@ -0,0 +1,142 @@
+import gzip
+import io
+
+import pytest
+
+from alignment_headers import read_itf8, read_ltf8, read_bam_header, read_cram_header, read_sq_lines
+from bgzf import read_block
+
+pysam = pytest.importorskip("pysam")
+
+HEADER = {"HD": {"VN": "1.6", "SO": "coordinate"},
+          "SQ": [{"SN": "chr1", "LN": 248956422, "M5": "6aef897c3d6ff0c78aff06ac189178dd"},
+                 {"SN": "chrM", "LN": 16569}],
+          "PG": [{"ID": "bwa", "PN": "bwa"}]}
+SQ_LINES = ["@SQ\tSN:chr1\tLN:248956422\tM5:6aef897c3d6ff0c78aff06ac189178dd", "@SQ\tSN:chrM\tLN:16569"]
+# Header text longer than a BGZF block and than the bytes first read from a CRAM container
+LONG_HEADER = {"HD": {"VN": "1.6"}, "SQ": [{"SN": f"HLA-contig_{i}", "LN": 1000 + i} for i in range(3000)]}
+
+
+def encode_itf8(value):
+    value &= 0xFFFFFFFF
+    if value < 1 << 7:
+        return bytes([value])
+    if value < 1 << 14:
+        return bytes([0x80 | value >> 8, value & 0xFF])
+    if value < 1 << 21:
+        return bytes([0xC0 | value >> 16, value >> 8 & 0xFF, value & 0xFF])
+    if value < 1 << 28:
+        return bytes([0xE0 | value >> 24, value >> 16 & 0xFF, value >> 8 & 0xFF, value & 0xFF])
+    return bytes([0xF0 | value >> 28, value >> 20 & 0xFF, value >> 12 & 0xFF, value >> 4 & 0xFF, value & 0x0F])
+
+
+def encode_ltf8(value):
+    extra = next((k for k in range(8) if value < 1 << (7 + 7 * k)), 8)
+    first = (0xFF << (8 - extra)) & 0xFF | (value >> (8 * extra) if extra < 8 else 0)
+    return bytes([first]) + (value & ((1 << (8 * extra)) - 1)).to_bytes(extra, "big")
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 16383, 16384, (1 << 21) - 1, 1 << 21, (1 << 28) - 1, 1 << 28,
+                                   (1 << 31) - 1, -1, -(1 << 31)])
+def test_itf8(value):
+    data = b"\x00" + encode_itf8(value) + b"\xff"
+
+    assert read_itf8(data, 1) == (value, len(data) - 1)
+
+
+@pytest.mark.parametrize("value", [0, 127, 128, (1 << 14) - 1, 1 << 14, (1 << 35) + 5, (1 << 56) - 1, 1 << 56,
+                                   (1 << 64) - 1])
+def test_ltf8(value):
+    data = encode_ltf8(value) + b"\xff"
+
+    assert read_ltf8(data, 0) == (value, len(data) - 1)
+
+
+@pytest.fixture(autouse=True)
+def no_reference_lookups(tmp_path, monkeypatch):
+    """
+    htslib writes CRAMs looking the references up in REF_PATH (the EBI server by default): an empty directory here.
+    """
+    monkeypatch.setenv("REF_PATH", str(tmp_path / "refs"))
+    monkeypatch.setenv("REF_CACHE", str(tmp_path / "refs"))
+    save = pysam.set_verbosity(0)
+    yield
+    pysam.set_verbosity(save)
+
+
+def write_alignments(path, mode, header, **kwargs):
+    with pysam.AlignmentFile(str(path), mode, header=header, **kwargs):
+        pass
+    return str(path)
+
+
+def sq_lines(text):
+    return [line for line in text.splitlines() if line.startswith("@SQ\t")]
+
+
+def test_bam_header(tmp_path):
+    with open(write_alignments(tmp_path / "t.bam", "wb", HEADER), "rb") as bam:
+        text = read_bam_header(bam)
+
+    assert sq_lines(text) == SQ_LINES
+    assert text.startswith("@HD\tVN:1.6")
+
+
+def test_bam_header_spanning_blocks(tmp_path):
+    with open(write_alignments(tmp_path / "long.bam", "wb", LONG_HEADER), "rb") as bam:
+        lines = sq_lines(read_bam_header(bam))
+
+    assert len(lines) == 3000
+    assert lines[-1] == "@SQ\tSN:HLA-contig_2999\tLN:3999"
+
+
+def test_bam_references_without_sq_lines(tmp_path):
+    path = tmp_path / "no_sq.bam"
+    with pysam.AlignmentFile(str(path), "wb", text="@HD\tVN:1.6\n", reference_names=["chr1", "chr2"],
+                             reference_lengths=[100, 200]):
+        pass
+    with open(path, "rb") as bam:
+        assert sq_lines(read_bam_header(bam)) == ["@SQ\tSN:chr1\tLN:100", "@SQ\tSN:chr2\tLN:200"]
+
+
+@pytest.mark.parametrize("version", ["2.1", "3.0", "3.1"])
+def test_cram_header(tmp_path, version):
+    path = write_alignments(tmp_path / "t.cram", "wc", HEADER, format_options=[f"version={version}".encode()])
+    with open(path, "rb") as cram:
+        assert cram.read(6)[4:] == bytes(map(int, version.split(".")))
+        cram.seek(0)
+        assert sq_lines(read_cram_header(cram)) == SQ_LINES
+
+
+def test_cram_header_longer_than_the_first_read(tmp_path):
+    with open(write_alignments(tmp_path / "long.cram", "wc", LONG_HEADER), "rb") as cram:
+        lines = sq_lines(read_cram_header(cram))
+
+    assert len(lines) == 3000
+
+
+def test_read_sq_lines_tells_bam_and_cram_apart(tmp_path):
+    for name, mode in [("t.bam", "wb"), ("t.cram", "wc")]:
+        assert read_sq_lines(write_alignments(tmp_path / name, mode, HEADER)) == SQ_LINES
+
+
+def test_not_a_bam_or_a_cram(tmp_path):
+    with pytest.raises(ValueError):
+        read_cram_header(io.BytesIO(b"BAM\x01" + bytes(100)))
+    with pytest.raises(ValueError):
+        read_cram_header(io.BytesIO(b"CRAM\x01\x00" + bytes(100)))  # CRAM 1 isn't supported
+    path = tmp_path / "text.bam"
+    path.write_bytes(b"not an alignment file\n")
+    with pytest.raises(ValueError):
+        read_sq_lines(str(path))
+
+
+def test_truncated_bam_header(tmp_path):
+    with open(write_alignments(tmp_path / "long.bam", "wb", LONG_HEADER), "rb") as bam:
+        first_block = read_block(bam)
+        data = first_block + bam.read()
+
+    with pytest.raises(ValueError):
+        read_bam_header(io.BytesIO(first_block))
+    with pytest.raises(gzip.BadGzipFile):
+        read_bam_header(io.BytesIO(data[:len(first_block) + 100]))
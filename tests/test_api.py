@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+import api
+import variant_files
+from results import InferenceResult
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "refgenDetector")
+
+
+def test_importing_the_api_doesnt_load_numpy():
+    code = "import sys, api; print(sorted({'numpy', 'variant_files', 'plink_files'} & set(sys.modules)))"
+    loaded = subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, check=True)
+
+    assert loaded.stdout.strip() == "[]"
+
+
+def test_default_error_rate_is_the_one_of_the_scans():
+    assert api.ERROR_RATE == variant_files.ERROR_RATE
+
+
+def test_infer_vcf(tmp_path, reference_tables):
+    positions = [100, 200, 300]
+    reference_tables("chr21", {"GRCh37": (positions, "ACG"), "GRCh38": (positions, "TTT")})
+    path = tmp_path / "sample.vcf"
+    path.write_text("##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+                    + "".join(f"chr21\t{position}\t.\t{ref}\tN\t.\t.\t.\n" for position, ref in zip(positions, "ACG")))
+    result = api.infer_vcf(str(path), error_rate=None)
+
+    assert isinstance(result, InferenceResult)
+    assert result.variant_matches == {"GRCh37": 3, "GRCh38": 0}
+    assert result.variant_build == "GRCh37"
@@ -0,0 +1,132 @@
+import gzip
+import struct
+import zlib
+
+import pytest
+
+from inputs import PREFIX_BYTES, open_input, content_prefix, text_encoding, sniff_type
+
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+TEXTS = {
+    "VCF": b"##fileformat=VCFv4.2\n##contig=<ID=chr1,length=248956422>\n"
+           b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\nchr1\t10177\t.\tA\tAC\t.\tPASS\t.\n",
+    "VCF without fileformat": b"##contig=<ID=chr1,length=248956422>\n"
+                              b"##INFO=<ID=DP,Number=1,Type=Integer,Description=\"Depth\">\n"
+                              b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\nchr1\t10177\t.\tA\tAC\t.\tPASS\t.\n",
+    "VCF meta lines only": b"##contig=<ID=chr1,length=248956422>\n" * 10,
+    "VCF columns only": b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tNA12878\n"
+                        b"chr1\t10177\t.\tA\tAC\t.\tPASS\t.\tGT\t0/1\n",
+    "VCF without header": b"chr1\t10177\t.\tA\tAC\t.\tPASS\t.\r\nchr1\t10235\t.\tT\tTA\t.\tPASS\t.\r\n",
+    "Header": b"@HD\tVN:1.6\n@SQ\tSN:chr1\tLN:248956422\n@SQ\tSN:chrM\tLN:16569\n",
+    "SAM": b"@SQ\tSN:chr1\tLN:248956422\nread1\t0\tchr1\t100\t60\t4M\t*\t0\t0\tACGT\tIIII\n",
+    "pvar": b"##fileformat=PVARv1.0\n#CHROM\tPOS\tID\tREF\tALT\n1\t10177\trs367896724\tA\tAC\n",
+    "pvar with contigs": b"##contig=<ID=1,length=249250621>\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tCM\n"
+                         b"1\t10177\trs367896724\tA\tAC\t.\t.\t0\n",
+    "pvar columns only": b"#CHROM\tPOS\tID\tREF\tALT\tCM\n1\t10177\trs367896724\tA\tAC\t0\n",
+    "bim": b"1\trs367896724\t0\t10177\tAC\tA\n1\trs540431307\t0\t10235\tTA\tT\n",
+}
+EXPECTED = {"VCF": "VCF", "VCF without fileformat": "VCF", "VCF meta lines only": "VCF", "VCF columns only": "VCF",
+            "VCF without header": "VCF", "Header": "Header", "SAM": "Header", "pvar": "BIM", "pvar with contigs": "BIM",
+            "pvar columns only": "BIM", "bim": "BIM"}
+
+
+def bgzip(data, block_size=0xFF00):
+    """
+    BGZF compressed data: blocks of at most block_size bytes followed by the end-of-file block.
+    """
+    blocks = []
+    for start in range(0, len(data), block_size):
+        chunk = data[start:start + block_size]
+        deflate = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = deflate.compress(chunk) + deflate.flush()
+        header = struct.pack("<BBBBIBBHBBHH", 0x1F, 0x8B, 8, 4, 0, 0, 0xFF, 6, ord("B"), ord("C"), 2,
+                             len(compressed) + 25)
+        blocks.append(header + compressed + struct.pack("<II", zlib.crc32(chunk), len(chunk)))
+    return b"".join(blocks) + BGZF_EOF
+
+
+COMPRESSIONS = {None: lambda data: data, "gzip": gzip.compress, "bgzf": bgzip}
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+@pytest.mark.parametrize("name", TEXTS)
+def test_text_inputs(name, compression):
+    prefix = COMPRESSIONS[compression](TEXTS[name])
+
+    assert content_prefix(prefix) == (compression, TEXTS[name])
+    assert sniff_type(prefix) == EXPECTED[name]
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+@pytest.mark.parametrize("content", [b"", b"\x00\x01\x02\x03 binary", b"a\tfive\tcolumn\tlong\tline\n",
+                                     b"1\trs1\t0\tpos\tA\tC\n", b"chr1\tpos\t.\tA\tC\t.\tPASS\t.\n",
+                                     b"# a comment\n1\trs1\t0\t10177\tA\tC\n", b"#CHROM\tSTART\tEND\n"])
+def test_unknown_inputs(content, compression):
+    assert sniff_type(COMPRESSIONS[compression](content)) is None
+
+
+def test_bam_magic_is_read_inflated_and_cram_magic_raw():
+    assert sniff_type(bgzip(b"BAM\x01" + bytes(28))) == "BAM/CRAM"
+    assert sniff_type(gzip.compress(b"CRAM\x03\x00")) is None
+
+
+def test_truncated_compressed_prefix():
+    assert content_prefix(bgzip(TEXTS["VCF"])[:40]) == ("bgzf", b"")
+    assert sniff_type(bgzip(TEXTS["VCF"])[:40]) is None
+    compression, content = content_prefix(gzip.compress(TEXTS["VCF"] * 1000)[:200])
+    assert compression == "gzip" and TEXTS["VCF"].startswith(content[:len(TEXTS["VCF"])])
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_open_input_gives_the_prefix_back(tmp_path, compression):
+    data = COMPRESSIONS[compression](TEXTS["VCF"] * 20000)
+    path = tmp_path / "cohort.vcf"
+    path.write_bytes(data)
+    prefix, stream = open_input(str(path))
+    with stream:
+        assert stream.read() == data
+
+    assert prefix == data[:PREFIX_BYTES]
+    assert sniff_type(prefix) == "VCF"
+
+
+@pytest.fixture
+def pysam(tmp_path, monkeypatch):
+    pysam = pytest.importorskip("pysam")
+    monkeypatch.setenv("REF_PATH", str(tmp_path / "refs"))  # no reference lookups when writing a CRAM
+    save = pysam.set_verbosity(0)
+    yield pysam
+    pysam.set_verbosity(save)
+
+
+def sniff_file(path):
+    prefix, stream = open_input(str(path))
+    stream.close()
+    return sniff_type(prefix)
+
+
+@pytest.mark.parametrize("mode", ["wb", "wc"])
+def test_alignment_files(tmp_path, pysam, mode):
+    path = tmp_path / "sample.aln"
+    with pysam.AlignmentFile(str(path), mode, header={"SQ": [{"SN": "chr1", "LN": 248956422}]}):
+        pass
+
+    assert sniff_file(path) == "BAM/CRAM"
+
+
+@pytest.mark.parametrize("mode", ["wb", "wu", "wz", "w"])
+def test_variant_files(tmp_path, pysam, mode):
+    header = pysam.VariantHeader()
+    header.contigs.add("chr1", length=248956422)
+    path = tmp_path / "cohort.var"
+    with pysam.VariantFile(str(path), mode, header=header) as variants:
+        variants.write(variants.new_record(contig="chr1", start=10176, alleles=("A", "AC")))
+
+    assert sniff_file(path) == "VCF"
+
+
+def test_text_encoding():
+    assert text_encoding("Île-de-France".encode("utf-8")) == "utf-8"
+    assert text_encoding("é".encode("utf-8")[:1]) == "utf-8"  # a character cut at the end of the prefix
+    assert text_encoding("Île-de-France".encode("iso-8859-1")) == "iso-8859-1"
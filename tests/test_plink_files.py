@@ -0,0 +1,69 @@
+import numpy as np
+
+from plink_files import open_plink
+from results import InferenceResult
+from variant_files import finish_variant_inference
+
+BASES = np.array(list("ACGT"))
+
+
+def fixed_alt_bim(tmp_path, reference_tables, n=2000, chance=0.4):
+    """
+    A .bim called against GRCh38 whose A1 is not random: C, or T when the GRCh38 base is C (A2). The other versions
+    have another base at every position, the A1 of the SNP with probability chance, so they match both alleles by
+    chance that often.
+    """
+    rng = np.random.default_rng(0)
+    positions = np.sort(rng.choice(np.arange(1, 10 * n), n, replace=False))
+    grch38 = BASES[rng.integers(0, 4, n)]
+    alt = np.where(grch38 == "C", "T", "C")
+    columns = {"GRCh38": (positions, grch38)}
+    for version in ["hg18", "GRCh37", "T2T"]:
+        others = np.array([[base for base in "ACGT" if base not in (ref, a)] for ref, a in zip(grch38, alt)])
+        other = others[np.arange(n), rng.integers(0, 2, n)]
+        columns[version] = (positions, np.where(rng.random(n) < chance, alt, other))
+    reference_tables("chr21", columns)
+
+    path = tmp_path / "fixed_alt.bim"
+    path.write_text("".join(f"21\trs{i}\t0\t{position}\t{a1}\t{a2}\n"
+                            for i, (position, a1, a2) in enumerate(zip(positions, alt, grch38))))
+    return str(path), n
+
+
+def test_bim_with_fixed_alt_is_inferred(tmp_path, reference_tables):
+    path, n = fixed_alt_bim(tmp_path, reference_tables)
+    result = open_plink(path, None, None, InferenceResult(path, "BIM"), error_rate=None)
+
+    assert result.variant_matches["GRCh38"] == n
+    # The chance matches of the other versions leave the exact count of GRCh38 under 50% of all the matches
+    assert result.variant_matches["GRCh38"] < sum(result.variant_matches.values()) / 2
+    assert result.variant_status == "inferred"
+    assert result.variant_build == "GRCh38"
+    assert result.variant_confidence > 1 - 1e-6
+
+
+def test_bim_with_fixed_alt_stops_early_on_the_right_version(tmp_path, reference_tables):
+    path, n = fixed_alt_bim(tmp_path, reference_tables)
+    result = open_plink(path, None, None, InferenceResult(path, "BIM"))
+
+    assert result.variant_status == "inferred"
+    assert result.variant_build == "GRCh38"
+
+
+def test_both_alleles_compares_the_leader_to_the_runner_up():
+    matches = {"hg18": 0, "GRCh37": 9000, "GRCh38": 16345, "T2T": 9375}
+
+    ref_column = finish_variant_inference(InferenceResult("x", "VCF"), dict(matches), False)
+    both_alleles = finish_variant_inference(InferenceResult("x", "BIM"), dict(matches), False, both_alleles=True)
+
+    assert ref_column.variant_status == "not_inferred"
+    assert both_alleles.variant_status == "inferred"
+    assert both_alleles.variant_build == "GRCh38"
+
+
+def test_both_alleles_tie_is_not_inferred():
+    result = finish_variant_inference(InferenceResult("x", "BIM"), {"GRCh37": 500, "GRCh38": 500}, False,
+                                      both_alleles=True)
+
+    assert result.variant_status == "not_inferred"
+    assert result.variant_build is None
@@ -0,0 +1,110 @@
+import argparse
+import gzip
+
+import numpy as np
+import pytest
+
+from refgenDetector_main import infer_file
+from results import InferenceResult
+from variant_files import open_vcf, chunk_memory_bytes, scan_records, VariantInference, STOP_CHECK_ROWS
+from vcf_tokenizer import chunk_rows, read_records, FIRST_CHUNK_ROWS, SITE_BYTES
+
+BASES = np.array(list("ACGT"))
+HEADER = "##fileformat=VCFv4.2\n##contig=<ID=chr21>\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+
+
+def leading_vcf(tmp_path, reference_tables, n=50000):
+    """
+    A sites-only VCF of n SNPs whose REF is the base of GRCh37 at every position of the chr21 table, where GRCh38 has
+    another base at every other position and the other versions another base everywhere.
+    """
+    rng = np.random.default_rng(0)
+    positions = np.arange(1, n + 1) * 10
+    grch37 = BASES[rng.integers(0, 4, n)]
+    other = BASES[(np.searchsorted(BASES, grch37) + 1) % 4]
+    reference_tables("chr21", {"GRCh37": (positions, grch37),
+                               "GRCh38": (positions, np.where(np.arange(n) % 2 == 0, grch37, other)),
+                               "hg18": (positions, other), "T2T": (positions, other)})
+    alt = BASES[(np.searchsorted(BASES, grch37) + 2) % 4]
+    path = tmp_path / "leading.vcf"
+    path.write_text(HEADER + "".join(f"chr21\t{position}\t.\t{ref}\t{a}\t.\tPASS\t.\n"
+                                     for position, ref, a in zip(positions.tolist(), grch37, alt)))
+    return str(path), n
+
+
+def test_vcf_scan_stops_in_the_first_chunk(tmp_path, reference_tables):
+    path, n = leading_vcf(tmp_path, reference_tables)
+    result = open_vcf(path, None, None)
+
+    assert result.variant_status == "inferred"
+    assert result.variant_build == "GRCh37"
+    assert result.variants_read <= FIRST_CHUNK_ROWS
+    assert result.variants_read < chunk_rows(len(open(path, "rb").read()) / n, chunk_memory_bytes()) // 10
+
+
+def test_unindexed_bcf_scan_stops_in_the_first_chunk(tmp_path, reference_tables):
+    pysam = pytest.importorskip("pysam")
+    path, n = leading_vcf(tmp_path, reference_tables)
+    bcf = str(tmp_path / "leading.bcf")
+    with pysam.VariantFile(path) as vcf, pysam.VariantFile(bcf, "wb", header=vcf.header) as out:
+        for record in vcf:
+            out.write(record)
+    result = open_vcf(bcf, None, None)
+
+    assert result.variant_status == "inferred"
+    assert result.variant_build == "GRCh37"
+    assert result.variants_read <= FIRST_CHUNK_ROWS < chunk_rows(SITE_BYTES, chunk_memory_bytes()) // 10
+
+
+def cli_args(**kwargs):
+    args = dict(type="VCF", matches=5000, max_n_var=None, error_rate=1e-6, sequential=False, threads=None)
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def test_few_matches_stop_the_scan_long_before_the_end(tmp_path, reference_tables):
+    path, n = leading_vcf(tmp_path, reference_tables)
+    result = infer_file(path, cli_args(matches=50, error_rate=0))
+
+    assert result.variant_build == "GRCh37"
+    assert 50 < result.variant_matches["GRCh37"] <= STOP_CHECK_ROWS
+    assert result.variants_read <= STOP_CHECK_ROWS < n
+
+
+@pytest.mark.parametrize("n_matches, error_rate", [(50, None), (None, 1e-6)])
+def test_stop_rules_are_checked_inside_a_chunk(tmp_path, reference_tables, n_matches, error_rate):
+    path, n = leading_vcf(tmp_path, reference_tables)
+    session = VariantInference(InferenceResult(path, "VCF"), n_matches, error_rate=error_rate)
+    with open(path, "rb") as vcf:
+        chunk = next(read_records(vcf, session.chrom_names, 1 << 28))
+    result = scan_records(iter([chunk]), session)
+
+    assert len(chunk["pos"]) >= 4 * STOP_CHECK_ROWS
+    assert result.variants_read == STOP_CHECK_ROWS
+    assert result.variant_build == "GRCh37"
+
+
+def test_matches_counted_by_blocks_are_those_of_the_whole_chunk(tmp_path, reference_tables):
+    path, n = leading_vcf(tmp_path, reference_tables)
+    result = infer_file(path, cli_args(matches=None, error_rate=0))
+
+    assert result.variants_read == n
+    assert result.variant_matches == {"GRCh37": n, "GRCh38": n // 2, "hg18": 0, "T2T": 0}
+
+
+@pytest.mark.parametrize("corrupt", [lambda data: data[:len(data) // 2],
+                                     lambda data: gzip.compress(b"BCF\x02\x02" + b"\xff" * 500)],
+                         ids=["truncated", "invalid header"])
+@pytest.mark.parametrize("file_type", ["VCF", None])
+def test_corrupted_bcf_is_an_error(tmp_path, reference_tables, corrupt, file_type):
+    pysam = pytest.importorskip("pysam")
+    path, n = leading_vcf(tmp_path, reference_tables, 2000)
+    bcf = tmp_path / "corrupted.bcf"
+    with pysam.VariantFile(path) as vcf, pysam.VariantFile(str(bcf), "wb", header=vcf.header) as out:
+        for record in vcf:
+            out.write(record)
+    bcf.write_bytes(corrupt(bcf.read_bytes()))
+    result = infer_file(str(bcf), cli_args(type=file_type))
+
+    assert result.status == "error"
+    assert result.variant_status is None
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+import variant_tables
+from variant_tables import (load_table, merge_msgpacks, chromosome_sources, find_rows, decode_bases, count_matches,
+                            match_rows, encode_bases, prefilter_positions, TABLE_ARRAYS)
+
+VERSIONS = ["hg18", "GRCh37", "GRCh38", "T2T"]
+# Mostly A, C, G and T, with the escaped codes: N, - and IUPAC ambiguity codes kept as exceptions
+BASE_CHOICES = np.array(list("ACGTNR-Y"))
+BASE_WEIGHTS = [0.23, 0.23, 0.23, 0.23, 0.03, 0.02, 0.02, 0.01]
+
+
+@pytest.fixture
+def columns():
+    """
+    Positions of one chromosome with small gaps and gaps longer than a delta (new blocks), each version holding a base
+    at a different subset of them.
+    """
+    rng = np.random.default_rng(1)
+    gaps = np.where(rng.random(5000) < 0.02, rng.integers(256, 100000, 5000), rng.integers(1, 60, 5000))
+    positions = 10000 + np.cumsum(gaps)
+    result = {}
+    for version in VERSIONS:
+        present = rng.random(len(positions)) < 0.7
+        result[version] = (positions[present], rng.choice(BASE_CHOICES, present.sum(), p=BASE_WEIGHTS))
+    return result
+
+
+@pytest.fixture
+def table(tmp_path, reference_tables, columns):
+    reference_tables("chr21", columns)
+    return load_table("chr21", str(tmp_path / "msgpacks"), str(tmp_path / "tables"))
+
+
+def test_table_round_trip(table, columns):
+    positions = np.unique(np.concatenate([column_positions for column_positions, _ in columns.values()]))
+    expected = np.zeros((len(positions), len(VERSIONS)), dtype=np.uint8)
+    for i, version in enumerate(VERSIONS):
+        column_positions, bases = columns[version]
+        expected[np.searchsorted(positions, column_positions), i] = encode_bases(bases)
+
+    found, rows = find_rows(table, positions)
+
+    assert table["versions"] == VERSIONS and table["rows"] == len(positions)
+    assert isinstance(table["codes"], np.memmap)
+    assert found.all()
+    np.testing.assert_array_equal(decode_bases(table, rows), expected)
+
+
+def test_mapped_table_equals_packed_table(tmp_path, table):
+    packed = merge_msgpacks(chromosome_sources("chr21", str(tmp_path / "msgpacks")))
+
+    for array_name in TABLE_ARRAYS:
+        np.testing.assert_array_equal(table[array_name], packed[array_name], err_msg=array_name)
+
+
+def test_positions_missing_from_the_table(table, columns):
+    positions = np.unique(np.concatenate([column_positions for column_positions, _ in columns.values()]))
+    # Next to the positions of the table, in its gaps and out of its range
+    neighbours = np.concatenate([positions - 1, positions + 1, positions + 300, [0, positions[-1] + 10 ** 6]])
+    missing = np.setdiff1d(neighbours, positions)
+
+    assert not prefilter_positions(table, missing).any()
+    assert not find_rows(table, missing)[0].any()
+
+
+def test_count_matches_equals_a_naive_lookup(table, columns):
+    rng = np.random.default_rng(2)
+    in_table = rng.choice(columns["GRCh38"][0], 2000, replace=False)
+    anywhere = rng.integers(0, int(in_table.max()) + 1000, 2000)
+    positions = np.unique(np.concatenate([in_table, anywhere]))
+    refs = rng.choice(np.array(["A", "C", "G", "T", "N", "R", "a", "<NON_REF>"]), len(positions))
+
+    naive = []
+    for version in VERSIONS:
+        reference = dict(zip(columns[version][0].tolist(), columns[version][1].tolist()))
+        naive.append([reference.get(position) == ref for position, ref in zip(positions.tolist(), refs)])
+
+    assert match_rows(table, positions, encode_bases(refs)).T.tolist() == naive
+    naive = [sum(matched) for matched in naive]
+    assert count_matches(table, positions, encode_bases(refs)).tolist() == naive
+    assert sum(naive) > 0
+
+
+def test_count_matches_of_an_empty_chunk(table):
+    counts = count_matches(table, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8))
+
+    assert counts.tolist() == [0] * len(VERSIONS)
+
+
+def test_changed_msgpack_is_converted_again(tmp_path, reference_tables, columns, table):
+    positions, bases = columns["GRCh38"]
+    flipped = np.where(bases == "A", "C", np.where(bases == "C", "A", bases))  # same size, other content
+    reference_tables("chr21", {"GRCh38": (positions, flipped)}, convert=False)
+    entry = variant_tables.read_manifest(str(tmp_path / "tables"))["tables"]["chr21"]
+    assert not variant_tables.is_current(entry, str(tmp_path / "msgpacks"))
+
+    reloaded = load_table("chr21", str(tmp_path / "msgpacks"), str(tmp_path / "tables"))
+
+    _, rows = find_rows(reloaded, positions)
+    np.testing.assert_array_equal(decode_bases(reloaded, rows)[:, VERSIONS.index("GRCh38")], encode_bases(flipped))
+    assert variant_tables.read_manifest(str(tmp_path / "tables"))["tables"]["chr21"]["rows"] == reloaded["rows"]
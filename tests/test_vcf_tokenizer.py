@@ -0,0 +1,103 @@
+import io
+
+import numpy as np
+import pytest
+
+from vcf_tokenizer import (tokenize, tokenize_slow, read_records, concatenate_records, chunk_rows, RECORD_FIELDS,
+                           BIM_COLUMNS, WINDOW, FIRST_CHUNK_ROWS)
+
+SAMPLES = "\t".join(["GT:AD:DP"] + ["0/1:10,12:22"] * 50)
+VCF_LINES = [
+    b"##fileformat=VCFv4.2",
+    b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1",
+    f"chr1\t10177\trs1\tA\tC\t100\tPASS\t.\t{SAMPLES}".encode(),
+    b"chr1\t10352\trs2\tT\tTA\t100\tPASS\t.",  # insertion
+    b"chr1\t10616\t.\tCCGCCGTTGCAAAGGCGCGCCG\tC\t.\t.\t.",  # deletion
+    b"chr1\t11012\t.\tC\tG,T\t.\t.\t.",  # multi-allelic SNP
+    b"chr1\t11063\t.\tT\tG,TA,<NON_REF>\t.\t.\t.",  # multi-allelic with an indel, gVCF
+    b"chr2\t12000\t.\tg\t<NON_REF>\t.\t.\tEND=12010",  # gVCF block, lower case REF
+    b"chr2\t12011\t.\ta\tc,<NON_REF>\t.\t.\t.\r",  # CRLF line
+    b"2\t13000\t.\tN\t.\t.\t.\t.",  # no ALT
+    b"chrX\t14000\t.\tA\tG\t.\t.\t.",
+    b"chr1\t15000\t.\t" + b"A" * (2 * WINDOW) + b"\tG\t.\t.\t.",  # last needed tab beyond the window
+    b"chr1\t16000\t.\tA\t" + b"C" * (2 * WINDOW) + b",G\t.\t.\t.",  # long multi-allelic ALT
+    b"chrX\t17000\t.\tC\tA",  # nothing after ALT
+]
+
+
+def slow_records(lines, names, columns=None):
+    """
+    The records of the data lines tokenized one by one with tokenize_slow().
+    """
+    kwargs = {} if columns is None else {"columns": columns}
+    rows = [tokenize_slow(line, names, **kwargs) for line in lines if line and not line.startswith(b"#")]
+    return {field: np.array(values) for field, values in zip(RECORD_FIELDS, zip(*rows))}
+
+
+def assert_same_records(records, names, expected, expected_names):
+    """
+    Same records, the codes of CHROM compared by the names they stand for (new names can be coded in another order).
+    """
+    np.testing.assert_array_equal(np.array(names)[records["chrom"]], np.array(expected_names)[expected["chrom"]])
+    for field in RECORD_FIELDS[1:]:
+        np.testing.assert_array_equal(records[field], expected[field], err_msg=field)
+
+
+@pytest.mark.parametrize("memory_bytes", [None, 1, 4096])
+def test_tokenize_matches_tokenize_slow_on_mixed_and_multi_allelic_lines(memory_bytes):
+    names, slow_names = [], []
+    records = tokenize(b"\n".join(VCF_LINES) + b"\n", names, memory_bytes)
+
+    assert_same_records(records, names, slow_records(VCF_LINES, slow_names), slow_names)
+    assert sorted(names) == sorted(slow_names) == ["2", "chr1", "chr2", "chrX"]
+
+
+def test_tokenize_fields_of_multi_allelic_and_gvcf_lines():
+    records = tokenize(b"\n".join(VCF_LINES) + b"\n", [])
+
+    row = list(records["pos"]).index(11012)
+    assert (records["ref"][row], records["alt"][row]) == (ord("C"), ord("G"))
+    assert (records["ref_len"][row], records["alt_len"][row]) == (1, 3)
+    gvcf_block = list(records["pos"]).index(12000)
+    assert records["ref"][gvcf_block] == ord("G")
+    assert records["alt_non_ref"][gvcf_block] and records["has_non_ref"][gvcf_block]
+    crlf = list(records["pos"]).index(12011)
+    assert records["alt_len"][crlf] == len("c,<NON_REF>")
+    assert not records["alt_non_ref"][crlf] and records["has_non_ref"][crlf]
+
+
+def test_tokenize_bim_columns():
+    lines = [b"1\trs1\t0\t10177\tA\tC", b"23\trs2\t0.5\t2700000\tg\tt", b"1\trs3\t0\t10352\tTA\tT"]
+    names, slow_names = [], []
+    records = tokenize(b"\n".join(lines) + b"\n", names, columns=BIM_COLUMNS)
+
+    assert_same_records(records, names, slow_records(lines, slow_names, BIM_COLUMNS), slow_names)
+    assert sorted(names) == ["1", "23"]
+
+
+def test_read_records_chunks_match_tokenize():
+    buffer = b"\n".join(VCF_LINES * 200) + b"\n"
+    names, chunk_names = [], []
+    chunks = list(read_records(io.BytesIO(buffer), chunk_names, 1 << 16))
+
+    assert len(chunks) > 1
+    assert_same_records(concatenate_records(chunks), chunk_names, tokenize(buffer, names), names)
+
+
+def test_read_records_chunks_grow_up_to_the_budget():
+    buffer = b"".join(b"chr1\t%d\t.\tA\tC\t.\t.\t.\n" % position for position in range(1, 200001))
+    memory_bytes = 1 << 26
+    sizes = [len(chunk["pos"]) for chunk in read_records(io.BytesIO(buffer), [], memory_bytes)]
+
+    cap = chunk_rows(len(buffer) / 200000, memory_bytes)
+    assert sizes[:3] == [FIRST_CHUNK_ROWS, 2 * FIRST_CHUNK_ROWS, 4 * FIRST_CHUNK_ROWS]
+    assert max(sizes) == cap < sum(sizes)
+    assert sum(sizes) == 200000
+
+
+def test_pos_not_a_number():
+    line = b"chr1\tabc\t.\tA\tC\t.\t.\t."
+    with pytest.raises(ValueError):
+        tokenize(line + b"\n", [])
+    with pytest.raises(ValueError):
+        tokenize_slow(line, [])